@@ -0,0 +1,113 @@
+import asyncio
+
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Awaitable, Optional
+
+from telebot import asyncio_helper
+from telebot.apihelper import ApiTelegramException
+from telebot.async_telebot import AsyncTeleBot
+
+from app.admin import AdminService
+from app.bot import MESSAGE_CONTENT_TYPES, build_handlers
+from app.db import Database
+from app.dispatch import KeyedDispatcher
+from app.llm import LLM
+from app.overload import OverloadController
+
+# Upper bound for a bridged Telegram call made from a handler thread
+BRIDGE_CALL_TIMEOUT = 120.0
+
+
+class AsyncBotBridge:
+    """Blocking TeleBot-style facade over an ``AsyncTeleBot``.
+
+    The shared handlers run in worker threads (SQLite has no async API) and
+    call the bot synchronously; each call is scheduled on the event loop that
+    owns the aiohttp session and awaited from the worker. API errors are
+    re-raised as the sync ``ApiTelegramException`` the handlers already catch.
+
+    The ``submit_*`` methods only schedule the call and return its future, so
+    deferred replies and typing refreshes are awaited on the loop instead of
+    holding a scheduler thread.
+    """
+
+    def __init__(self, bot: AsyncTeleBot, loop: asyncio.AbstractEventLoop) -> None:
+        self._bot = bot
+        self._loop = loop
+        self.token = bot.token
+
+    def get_me(self):
+        return self._call(self._bot.get_me())
+
+    def reply_to(self, message, text: str, **kwargs):
+        return self._call(self._bot.reply_to(message, text, **kwargs))
+
+    def send_chat_action(self, chat_id: int, action: str, **kwargs):
+        return self._call(self._bot.send_chat_action(chat_id, action, **kwargs))
+
+    def submit_reply_to(self, message, text: str) -> Future:
+        return self._submit(self._bot.reply_to(message, text))
+
+    def submit_chat_action(self, chat_id: int, action: str) -> Future:
+        return self._submit(self._bot.send_chat_action(chat_id, action))
+
+    def get_chat_member(self, chat_id: int, user_id: int):
+        return self._call(self._bot.get_chat_member(chat_id, user_id))
+
+    def get_file(self, file_id: str):
+        return self._call(self._bot.get_file(file_id))
+
+    def download_file(self, file_path: str) -> bytes:
+        return self._call(self._bot.download_file(file_path))
+
+    def _submit(self, coroutine: Awaitable[Any]) -> Future:
+        return asyncio.run_coroutine_threadsafe(asyncio.wait_for(coroutine, BRIDGE_CALL_TIMEOUT), self._loop)
+
+    def _call(self, coroutine: Awaitable[Any]) -> Any:
+        future = asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+        try:
+            return future.result(timeout=BRIDGE_CALL_TIMEOUT)
+        except asyncio_helper.ApiTelegramException as exc:
+            raise ApiTelegramException(exc.function_name, exc.result, exc.result_json) from exc
+        except FutureTimeoutError:
+            future.cancel()
+            raise
+
+
+async def register_async_handlers(
+    bot: AsyncTeleBot,
+    db: Database,
+    llm: LLM,
+    admin_service: AdminService,
+    llm_timeout: float = 60.0,
+    dispatcher: Optional[KeyedDispatcher] = None,
+    describe_images: bool = True,
+) -> None:
+    """Register the shared handlers on an ``AsyncTeleBot``.
+
+    Each update is handled on a dispatcher worker thread, in order per chat,
+    so database work never blocks the loop; LLM calls already run on their
+    own loop and only hold a thread while a handler waits for an image
+    description. Deferred replies and typing go out on the loop without a
+    thread, but Telegram calls made inside a handler still block its worker,
+    so handler concurrency is capped by the dispatcher as in the sync runtime.
+    """
+    bridge = AsyncBotBridge(bot, asyncio.get_running_loop())
+    overload = OverloadController()
+    handle_message, handle_member_update = await asyncio.to_thread(
+        build_handlers, bridge, db, llm, admin_service, llm_timeout, overload, describe_images
+    )
+
+    if dispatcher is None:
+        dispatcher = KeyedDispatcher()
+
+    async def on_message(message) -> None:
+        dispatcher.submit(message.chat.id, handle_message, message)
+        overload.observe_depth(dispatcher.pending)
+
+    async def on_member_update(update) -> None:
+        dispatcher.submit(update.chat.id, handle_member_update, update)
+
+    bot.register_message_handler(on_message, content_types=MESSAGE_CONTENT_TYPES)
+    bot.register_chat_member_handler(on_member_update)
+    bot.register_my_chat_member_handler(on_member_update)
@@ -0,0 +1,58 @@
+import asyncio
+import os
+
+from telebot.async_telebot import AsyncTeleBot
+
+from app.admin import AdminService
+from app.async_bot import register_async_handlers
+from app.bot import ALLOWED_UPDATES
+from app.config import load_settings
+from app.db import Database
+from app.dispatch import KeyedDispatcher
+from app.llm import LLM
+
+
+async def run() -> None:
+    settings = load_settings()
+    db_dir = os.path.dirname(settings.database_path)
+    if db_dir:
+        os.makedirs(db_dir, exist_ok=True)
+    bot = AsyncTeleBot(settings.token)
+    db = Database.init(settings.database_path, read_pool_size=settings.database_read_pool_size)
+    llm = LLM(
+        llm_configs=settings.llm_configs,
+        image_config=settings.llm_image_config,
+        tokens_username=settings.llm_tokens_username,
+        tokens_password=settings.llm_tokens_password,
+        max_concurrency=settings.llm_max_concurrency,
+        max_pending=settings.llm_max_pending,
+        breaker_failures=settings.llm_breaker_failures,
+        breaker_cooldown=settings.llm_breaker_cooldown,
+        hedging=settings.llm_hedging,
+        hedge_delay=settings.llm_hedge_delay,
+        exploration=settings.llm_exploration,
+        streaming=settings.llm_streaming,
+        max_reply_sentences=settings.llm_max_reply_sentences,
+        max_reply_chars=settings.llm_max_reply_chars,
+    )
+    admin_service = AdminService(db)
+
+    try:
+        await register_async_handlers(
+            bot, db, llm, admin_service,
+            llm_timeout=settings.llm_reply_timeout,
+            dispatcher=KeyedDispatcher(settings.handler_workers),
+            describe_images=settings.describe_images,
+        )
+        await bot.infinity_polling(timeout=60, allowed_updates=ALLOWED_UPDATES)
+    finally:
+        await bot.close_session()
+        db.close()
+
+
+def main():
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,33 @@
-import base64
+import math
 import random
 import re
+import threading
+import time
 
 from datetime import datetime, timedelta, timezone
-from collections import defaultdict, deque
-from typing import DefaultDict, Deque, Dict, Optional, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
 
 from telebot import TeleBot
 from telebot.apihelper import ApiTelegramException
 
 from app.admin import AdminService
-from app.db import Database, QuestionTemplate, UserRecord, GLOBAL_CHAT_ID
-from app.llm import LLM
+from app.commands import CommandContext, CommandRouter, PhraseRouter
+from app.db import Database, QuestionTemplate, UserRecord, GLOBAL_CHAT_ID, MAX_USER_WEIGHT
+from app.descriptions import DescriptionCache, describe_photo
+from app.dispatch import KeyedDispatcher
+from app.llm import LLM, result_or_none
+from app.history import BOT_NAME, HistoryEntry, HistoryStore
+from app.media import MEDIA_MAX_CONCURRENT_DOWNLOADS, MediaFetcher, MediaHandle
+from app.members import MemberStatusCache
+from app.metrics import format_metrics, metrics
+from app.overload import (
+    TIER_COMMANDS_ONLY,
+    TIER_FALLBACK_INSULTS,
+    TIER_NO_IMAGE_DESCRIPTION,
+    TIER_NO_RANDOM_INSULTS,
+    OverloadController,
+)
 from app.texts import (
     FLEXIBLE_TIME_RESPONSES,
     INSULT_FALLBACKS,
@@ -23,17 +39,102 @@ from app.utils import (
     handle_question_templates,
     normalize_text,
     reply_with_typing,
+    send_reply_to,
     when,
-    find_question_match,
     reply_with_min_delay,
 )
 
 
-def register_handlers(bot: TeleBot, db: Database, llm: LLM, admin_service: AdminService) -> None:
-    HISTORY_LIMIT = 20
-    # Each entry: (display_name, content, reply_to_text or None)
-    # reply_to_text is a formatted string like "[БОТ]: текст" or "имя: текст"
-    chat_history: DefaultDict[int, Deque[Tuple[str, str, Optional[str]]]] = defaultdict(lambda: deque(maxlen=HISTORY_LIMIT))
+MESSAGE_CONTENT_TYPES = ["text", "photo", "video"]
+# Longest an insult waits, in total, for photo descriptions still pending in the history
+DESCRIPTION_WAIT_TIMEOUT = 10.0
+# chat_member updates are opt-in; they keep the owner/status cache fresh
+ALLOWED_UPDATES = ["message", "chat_member", "my_chat_member"]
+
+
+def register_handlers(
+    bot: TeleBot,
+    db: Database,
+    llm: LLM,
+    admin_service: AdminService,
+    llm_timeout: float = 60.0,
+    dispatcher: Optional[KeyedDispatcher] = None,
+    describe_images: bool = True,
+) -> None:
+    """Register the handlers; updates of one chat run in arrival order.
+
+    The bot should be created with ``threaded=False`` so updates reach the
+    dispatcher in the order Telegram delivered them.
+    """
+    overload = OverloadController()
+    handle_message, handle_member_update = build_handlers(
+        bot, db, llm, admin_service, llm_timeout, overload, describe_images
+    )
+    if dispatcher is None:
+        dispatcher = KeyedDispatcher()
+
+    def on_message(message) -> None:
+        dispatcher.submit(message.chat.id, handle_message, message)
+        overload.observe_depth(dispatcher.pending)
+
+    def on_member_update(update) -> None:
+        dispatcher.submit(update.chat.id, handle_member_update, update)
+
+    bot.register_message_handler(on_message, content_types=MESSAGE_CONTENT_TYPES)
+    bot.register_chat_member_handler(on_member_update)
+    bot.register_my_chat_member_handler(on_member_update)
+
+
+def build_handlers(
+    bot: TeleBot,
+    db: Database,
+    llm: LLM,
+    admin_service: AdminService,
+    llm_timeout: float = 60.0,
+    overload: Optional[OverloadController] = None,
+    describe_images: bool = True,
+) -> Tuple[Callable, Callable]:
+    """Create (handle_message, handle_member_update) shared by both runtimes.
+
+    ``bot`` only needs the blocking TeleBot methods the handlers call, so the
+    asyncio runtime passes a bridge object instead of a real ``TeleBot``.
+    Under load ``overload`` sheds work tier by tier (see ``app.overload``).
+    ``describe_images`` controls whether photos get an LLM description in the
+    chat history; without it a photo is downloaded only for an insult.
+    """
+    if overload is None:
+        overload = OverloadController()
+    media_fetcher = MediaFetcher(bot)
+    descriptions = DescriptionCache(db)
+    # Photo descriptions run here so handlers never wait for the vision model
+    description_executor = ThreadPoolExecutor(
+        max_workers=MEDIA_MAX_CONCURRENT_DOWNLOADS, thread_name_prefix="describe"
+    )
+
+    # The same photo posted to several chats at once is described by one task
+    inflight_descriptions: Dict[str, "Future[Optional[str]]"] = {}
+    inflight_lock = threading.Lock()
+
+    def describe_with_llm(image_url: str) -> Optional[str]:
+        return result_or_none(llm.submit_describe_image(image_url), llm_timeout)
+
+    def start_description(media: MediaHandle) -> "Future[Optional[str]]":
+        key = media.file_unique_id
+        with inflight_lock:
+            future = inflight_descriptions.get(key)
+            if future is not None:
+                return future
+            future = description_executor.submit(describe_photo, media, descriptions, describe_with_llm)
+            inflight_descriptions[key] = future
+
+        def forget(_done: "Future[Optional[str]]") -> None:
+            with inflight_lock:
+                inflight_descriptions.pop(key, None)
+
+        future.add_done_callback(forget)
+        return future
+    history = HistoryStore(db)
+    member_statuses = MemberStatusCache()
     try:
         bot_info = bot.get_me()
         bot_id = bot_info.id
@@ -42,35 +143,44 @@ def register_handlers(bot: TeleBot, db: Database, llm: LLM, admin_service: Admin
         bot_id = None
         bot_username = None
 
-    @bot.message_handler(content_types=["text", "photo", "video"])
+    def handle_member_update(update):
+        # Keeps the status cache fresh without polling get_chat_member
+        member = update.new_chat_member
+        status = getattr(member, "status", None)
+        member_statuses.store(update.chat.id, member.user.id, status)
+        if status == "creator":
+            admin_service.add_chat_admin(member.user.id, update.chat.id)
+
     def handle_message(message):
+        overload.observe_lag(time.time() - message.date)
+        tier = overload.tier
         user_id = message.from_user.id
         username = message.from_user.username
         display_name = _format_display_name(message.from_user)
         chat_id = message.chat.id
         raw_text = (message.text or message.caption or "") or ""
         text = normalize_text(raw_text.lower())
+        if tier >= TIER_COMMANDS_ONLY and _ADMIN_COMMANDS.resolve(text) is None:
+            metrics.inc("overload.shed_messages")
+            return
         db.ensure_user(user_id, username, chat_id)
 
         if admin_service.is_banned(user_id, chat_id):
             return
 
-        _ensure_chat_owner_admin(bot, chat_id, user_id, admin_service)
+        _ensure_chat_owner_admin(bot, chat_id, user_id, admin_service, member_statuses)
 
-        # Download photo early so we can describe it for history and reuse for insult
-        image_base64, image_mime = None, "image/jpeg"
+        # Photo bytes are fetched only if the description or the insult asks for them
+        media = None
+        if message.content_type == "photo" and message.photo and tier < TIER_FALLBACK_INSULTS:
+            media = MediaHandle(media_fetcher, message.photo, llm.image_budget)
+        pending_description = None
         if message.content_type == "photo":
-            image_base64, image_mime = _download_photo_base64(bot, message)
-            if image_base64:
-                description = llm.describe_image(image_base64, image_mime)
-                history_content = f"[изображение: {description}]" if description else "[изображение]"
-            else:
-                history_content = "[изображение]"
+            history_content = "[изображение]"
+            if media is not None and describe_images and tier < TIER_NO_IMAGE_DESCRIPTION:
+                pending_description = start_description(media)
         else:
             history_content = raw_text.strip() or _describe_non_text_message(message)
-        history_queue = chat_history.get(chat_id)
-        if history_queue is None:
-            history_queue = chat_history.setdefault(chat_id, deque(maxlen=HISTORY_LIMIT))
         user_history_committed = False
 
         # Build reply-to context if this message is a reply
@@ -91,22 +201,27 @@ def register_handlers(bot: TeleBot, db: Database, llm: LLM, admin_service: Admin
 
         def commit_user_history() -> None:
             nonlocal user_history_committed
-            if user_history_committed or not history_content or history_queue is None:
+            if user_history_committed or not history_content:
                 return
-            history_queue.append((display_name, history_content, reply_to_text))
+            entry = HistoryEntry(display_name, history_content, reply_to_text, pending_description)
+            history.append(chat_id, entry)
             user_history_committed = True
+            if pending_description is not None:
+                pending_description.add_done_callback(
+                    lambda done: _fill_description(history, chat_id, entry, done)
+                )
 
         def log_bot_history(text: str) -> None:
-            if not text or history_queue is None:
+            if not text:
                 return
-            history_queue.append(("Быдлик", text, None))
+            history.append(chat_id, HistoryEntry(BOT_NAME, text))
 
         def send_reply(bot: TeleBot, message, text: str) -> None:
             commit_user_history()
             reply_with_typing(bot, message, text)
             log_bot_history(text)
 
-        if _handle_admin_commands(
+        command_context = CommandContext(
             bot,
             message,
             text,
@@ -117,93 +232,50 @@ def register_handlers(bot: TeleBot, db: Database, llm: LLM, admin_service: Admin
             admin_service,
             llm,
             send_reply,
-        ):
+        )
+        if _ADMIN_COMMANDS.dispatch(command_context):
             commit_user_history()
             return
 
         template_scope = None if getattr(message.chat, "type", "") == "private" else chat_id
-        question_templates = db.get_question_templates(template_scope)
-        question_match = find_question_match(text, question_templates)
+        question_matcher = db.get_question_matcher(template_scope)
+        question_match = question_matcher.match(text)
 
         scope_for_settings = chat_id if template_scope is not None else None
-        insult_probability = db.get_insult_probability(scope_for_settings)
-        insult_level = db.get_insult_level(scope_for_settings)
-        question_phrase_chance = db.get_question_phrase_chance(scope_for_settings)
-        when_phrase_chance = db.get_when_phrase_chance(scope_for_settings)
+        settings = db.get_effective_settings(scope_for_settings)
+        insult_probability = settings.insult_probability
+        insult_level = settings.insult_level
+        question_phrase_chance = settings.question_phrase_chance
         if insult_level <= 1:
             insult_probability = 0.0
         boost_on_reply = _is_reply_to_bot(message, bot_id, bot_username)
         if (("быдлик" in text and question_match is None) or boost_on_reply) and insult_probability > 0:
-            boost = db.get_insult_boost_multiplier(scope_for_settings)
-            insult_probability = min(1.0, insult_probability * boost)
+            insult_probability = min(1.0, insult_probability * settings.insult_boost_multiplier)
 
-        already_replied = handle_question_templates(
+        already_replied = question_match is not None and handle_question_templates(
             bot,
             message,
             text,
             chat_id,
             db,
             user_id=user_id,
-            templates=question_templates,
+            templates=question_matcher.templates,
             match=question_match,
             phrase_chance=question_phrase_chance,
             reply_func=send_reply,
         )
 
-        if not already_replied and "быдлик не тегай меня" in text:
-            tag_status = db.get_tag_status(user_id, chat_id)
-            if tag_status:
-                db.set_tag_status(user_id, chat_id, False)
-                send_reply(
-                    bot,
-                    message,
-                    'Готово\nЕсли захочешь, чтобы я снова тебя тегал, просто напиши мне "Быдлик тегай меня"',
-                )
-            else:
-                send_reply(bot, message, "Ты уже просил, я тебя не тегаю")
-            already_replied = True
-
-        elif not already_replied and "быдлик тегай меня" in text:
-            tag_status = db.get_tag_status(user_id, chat_id)
-            if not tag_status:
-                db.set_tag_status(user_id, chat_id, True)
-                send_reply(
-                    bot,
-                    message,
-                    'Готово\nЕсли захочешь, чтобы я перестал тебя тегать, просто напиши мне "Быдлик не тегай меня"',
-                )
-            else:
-                send_reply(bot, message, "Я тебя и так тегаю")
-            already_replied = True
-
-        elif not already_replied and "быдлик насколько" in text:
-            que_s = text.split("насколько", 1)
-            que = que_s[1]
-            seed = generate_seed(que, user_id)
-            random.seed(int(seed))
-            result = str(random.randrange(1, 100) + 1)
-            send_reply(bot, message, "На" + " " + result + "%")
-            already_replied = True
-
-        elif not already_replied and "быдлик когда" in text:
-            if random.random() < when_phrase_chance:
-                result = random.choice(FLEXIBLE_TIME_RESPONSES)
-            else:
-                date_choice = random.choice(TIME_UNIT_OPTIONS)
-                numbers = random.randrange(1, 100)
-                result = when(date_choice, numbers)
-            send_reply(bot, message, result)
-            already_replied = True
-
-        elif not already_replied and "быдлик " in text and " или " in text:
-            que_s = text.split("быдлик", 1)[1].split(" или ")
-            if not que_s[0].strip():
-                que_s = que_s[1:]
-            result = random.choice(que_s)
-            send_reply(bot, message, result)
-            already_replied = True
+        if not already_replied:
+            already_replied = _CHAT_PHRASES.dispatch(command_context)
+
+        if tier >= TIER_NO_RANDOM_INSULTS:
+            insult_probability = 0.0
 
         if not already_replied and insult_probability > 0 and random.random() < insult_probability:
+            if tier >= TIER_FALLBACK_INSULTS:
+                send_reply(bot, message, random.choice(INSULT_FALLBACKS))
+                return
+
             if message.content_type == "photo":
                 prompt = message.caption or "[изображение]"
             elif message.content_type == "video":
@@ -214,444 +286,533 @@ def register_handlers(bot: TeleBot, db: Database, llm: LLM, admin_service: Admin
             if reply_to_text:
                 prompt = f"{prompt} [в ответ на: \"{reply_to_text}\"]"
 
-            history_queue = chat_history.get(chat_id)
             history_lines = []
-            for name, content, reply_to in list(history_queue or []):
-                if name == "Быдлик":
-                    line = f"[БОТ]: {content}"
-                else:
-                    line = f"{name}: {content}"
-                if reply_to:
-                    line = f"{line} [в ответ на: \"{reply_to}\"]"
-                history_lines.append(line)
+            descriptions_deadline = time.monotonic() + DESCRIPTION_WAIT_TIMEOUT
+            for entry in history.entries(chat_id):
+                entry.wait(max(0.0, descriptions_deadline - time.monotonic()))
+                history_lines.append(entry.line)
 
-            answer = reply_with_min_delay(
+            image_url = media.data_url() if media is not None and llm.accepts_images else None
+
+            def deliver_insult(answer: Optional[str]) -> Optional[Future]:
+                if answer is None:
+                    answer = random.choice(INSULT_FALLBACKS)
+                log_bot_history(answer)
+                return send_reply_to(bot, message, answer)
+
+            commit_user_history()
+            reply_with_min_delay(
                 bot,
                 message,
-                llm_func=lambda: llm.generate_insult(
+                llm.submit_insult(
                     display_name, prompt, insult_level, history_lines,
-                    image_base64=image_base64, image_mime=image_mime,
+                    image_url=image_url,
                 ),
+                deliver_insult,
                 min_seconds=2,
+                timeout=llm_timeout,
             )
-            if answer is None:
-                answer = random.choice(INSULT_FALLBACKS)
-
-            commit_user_history()
-            bot.reply_to(message, answer)
-            log_bot_history(answer)
 
         commit_user_history()
 
+    return handle_message, handle_member_update
 
-def _handle_admin_commands(
-    bot: TeleBot,
-    message,
-    text: str,
-    raw_text: str,
-    user_id: int,
-    chat_id: int,
-    db: Database,
-    admin_service: AdminService,
-    llm: Optional[LLM] = None,
-    reply_func=reply_with_typing,
-) -> bool:
-    chat_type = getattr(message.chat, "type", "")
-    is_private_chat = chat_type == "private"
-    has_chat_admin_rights = admin_service.is_chat_admin(user_id, chat_id) if not is_private_chat else False
-    is_global_admin = admin_service.is_admin(user_id)
-
-    if text.startswith("быдлик добавь вопрос"):
-        if not (is_global_admin or has_chat_admin_rights):
-            reply_func(bot, message, "Только администраторы могут добавлять вопросы")
-            return True
-
-        payload = _extract_payload(raw_text, "быдлик добавь вопрос")
-        parts = [part.strip() for part in payload.split("|")]
-        if len(parts) != 2 or not all(parts):
-            reply_func(
-                bot,
-                message,
-                "Формат: Быдлик добавь вопрос триггер|ответ (используй {mention}, {question}, {number}, {percent})",
-            )
-            return True
-
-        trigger_text, template_text = parts
-        target_chat_id = GLOBAL_CHAT_ID if (is_private_chat and is_global_admin) else chat_id
-        if is_private_chat and not is_global_admin:
-            reply_func(bot, message, "Глобальные шаблоны можно менять только глобальным администраторам")
-            return True
-        existing_triggers = db.get_question_triggers(None if target_chat_id == GLOBAL_CHAT_ID else target_chat_id)
-        if trigger_text.lower() in existing_triggers:
-            reply_func(bot, message, "Такой вопрос уже существует")
-            return True
-
-        db.save_question_template(
-            QuestionTemplate(
-                trigger_text=trigger_text.lower(),
-                response_template=template_text,
-                chat_id=target_chat_id,
-            )
+
+def _fill_description(
+    history: HistoryStore, chat_id: int, entry: HistoryEntry, done: "Future[Optional[str]]"
+) -> None:
+    # Replaces the photo placeholder in place once the description is known
+    description = None if done.cancelled() or done.exception() is not None else done.result()
+    if description:
+        entry.content = f"[изображение: {description}]"
+        history.update(chat_id, entry)
+    entry.pending = None
+
+
+# Commands that must start the message; resolved through a prefix trie
+_ADMIN_COMMANDS = CommandRouter()
+# Entertainment phrases that may appear anywhere; the first registered rule wins
+_CHAT_PHRASES = PhraseRouter()
+
+
+@_ADMIN_COMMANDS.command("быдлик добавь вопрос")
+def _add_question(ctx: CommandContext, prefix: str) -> bool:
+    if not ctx.is_any_admin:
+        ctx.reply("Только администраторы могут добавлять вопросы")
+        return True
+
+    payload = _extract_payload(ctx.raw_text, prefix)
+    parts = [part.strip() for part in payload.split("|")]
+    if len(parts) != 2 or not all(parts):
+        ctx.reply(
+            "Формат: Быдлик добавь вопрос триггер|ответ (используй {mention}, {question}, {number}, {percent})"
         )
-        scope = "глобально" if target_chat_id == GLOBAL_CHAT_ID else "для этого чата"
-        reply_func(bot, message, f"Шаблон сохранён {scope}")
-        return True
-
-    if text.startswith("быдлик удали вопрос"):
-        if not (is_global_admin or has_chat_admin_rights):
-            reply_func(bot, message, "Только администраторы могут удалять вопросы")
-            return True
-
-        payload = _extract_payload(raw_text, "быдлик удали вопрос")
-        trigger_text = payload.strip()
-        if not trigger_text:
-            reply_func(bot, message, "Формат: Быдлик удали вопрос <текст вопроса>")
-            return True
-
-        target_chat_id = GLOBAL_CHAT_ID if (is_private_chat and is_global_admin) else chat_id
-        if is_private_chat and not is_global_admin:
-            reply_func(bot, message, "Глобальные шаблоны можно менять только глобальным администраторам")
-            return True
-
-        deleted = db.delete_question_template(target_chat_id, trigger_text.lower())
-        if not deleted:
-            reply_func(bot, message, "Такого вопроса нет")
-            return True
-
-        scope = "глобально" if target_chat_id == GLOBAL_CHAT_ID else "для этого чата"
-        reply_func(bot, message, f"Вопрос удалён {scope}")
-        return True
-
-    if text.startswith("быдлик шанс оскорбления"):
-        if is_private_chat and not is_global_admin:
-            reply_func(bot, message, "Глобальный шанс оскорбления может менять только глобальный администратор")
-            return True
-
-        if not is_private_chat and not (is_global_admin or has_chat_admin_rights):
-            reply_func(bot, message, "Только администраторы могут обновлять шанс оскорбления в чате")
-            return True
-
-        payload = _extract_payload(raw_text, "быдлик шанс оскорбления")
-        try:
-            value = float(payload.replace("%", "").strip())
-        except ValueError:
-            reply_func(bot, message, "Формат: Быдлик шанс оскорбления 5.5 (в процентах)")
-            return True
-
-        clamped_value = max(0.0, min(100.0, value))
-        target_chat_id = None if is_private_chat else chat_id
-        db.set_insult_probability(clamped_value / 100, target_chat_id)
-        if target_chat_id is None:
-            reply_func(bot, message, f"Глобальный шанс оскорбления обновлён до {clamped_value:.2f}%")
-        else:
-            reply_func(bot, message, f"Шанс оскорбления в этом чате обновлён до {clamped_value:.2f}%")
         return True
 
-    if text.startswith("быдлик уровень оскорблений"):
-        if is_private_chat and not is_global_admin:
-            reply_func(bot, message, "Глобальный уровень оскорблений может менять только глобальный администратор")
-            return True
+    trigger_text, template_text = parts
+    target_chat_id = GLOBAL_CHAT_ID if (ctx.is_private_chat and ctx.is_global_admin) else ctx.chat_id
+    if ctx.is_private_chat and not ctx.is_global_admin:
+        ctx.reply("Глобальные шаблоны можно менять только глобальным администраторам")
+        return True
+    existing_triggers = ctx.db.get_question_triggers(None if target_chat_id == GLOBAL_CHAT_ID else target_chat_id)
+    if trigger_text.lower() in existing_triggers:
+        ctx.reply("Такой вопрос уже существует")
+        return True
+
+    ctx.db.save_question_template(
+        QuestionTemplate(
+            trigger_text=trigger_text.lower(),
+            response_template=template_text,
+            chat_id=target_chat_id,
+        )
+    )
+    scope = "глобально" if target_chat_id == GLOBAL_CHAT_ID else "для этого чата"
+    ctx.reply(f"Шаблон сохранён {scope}")
+    return True
 
-        if not is_private_chat and not (is_global_admin or has_chat_admin_rights):
-            reply_func(bot, message, "Только администратор чата может менять уровень оскорблений")
-            return True
 
-        payload = _extract_payload(raw_text, "быдлик уровень оскорблений")
-        try:
-            level = int(payload.split()[0])
-        except (ValueError, IndexError):
-            reply_func(bot, message, "Формат: Быдлик уровень оскорблений N (1-4)")
-            return True
+@_ADMIN_COMMANDS.command("быдлик удали вопрос")
+def _delete_question(ctx: CommandContext, prefix: str) -> bool:
+    if not ctx.is_any_admin:
+        ctx.reply("Только администраторы могут удалять вопросы")
+        return True
 
-        if level < 1 or level > 4:
-            reply_func(bot, message, "Допустимые значения: 1, 2, 3 или 4")
-            return True
+    payload = _extract_payload(ctx.raw_text, prefix)
+    trigger_text = payload.strip()
+    if not trigger_text:
+        ctx.reply("Формат: Быдлик удали вопрос <текст вопроса>")
+        return True
 
-        target_chat_id = None if is_private_chat else chat_id
-        db.set_insult_level(level, target_chat_id)
-        if target_chat_id is None:
-            reply_func(bot, message, f"Глобальный уровень оскорблений установлен на {level}")
-        else:
-            reply_func(bot, message, f"Уровень оскорблений в этом чате установлен на {level}")
-        return True
-
-    if text.startswith("быдлик множитель оскорбления"):
-        if is_private_chat and not is_global_admin:
-            reply_func(bot, message, "Глобальный множитель оскорбления может менять только глобальный администратор")
-            return True
-
-        if not is_private_chat and not (is_global_admin or has_chat_admin_rights):
-            reply_func(bot, message, "Только администратор чата может менять множитель в этом чате")
-            return True
-
-        payload = _extract_payload(raw_text, "быдлик множитель оскорбления")
-        try:
-            value = float(payload.strip())
-        except ValueError:
-            reply_func(bot, message, "Формат: Быдлик множитель оскорбления 2 (минимум 1)")
-            return True
-
-        clamped_value = max(1.0, value)
-        target_chat_id = None if is_private_chat else chat_id
-        db.set_insult_boost_multiplier(clamped_value, target_chat_id)
-        if target_chat_id is None:
-            reply_func(bot, message, f"Глобальный множитель оскорбления обновлён до {clamped_value:.2f}")
-        else:
-            reply_func(bot, message, f"Множитель оскорбления в этом чате обновлён до {clamped_value:.2f}")
+    target_chat_id = GLOBAL_CHAT_ID if (ctx.is_private_chat and ctx.is_global_admin) else ctx.chat_id
+    if ctx.is_private_chat and not ctx.is_global_admin:
+        ctx.reply("Глобальные шаблоны можно менять только глобальным администраторам")
         return True
 
-    if text.startswith("быдлик шанс фразы в числовых"):
-        if is_private_chat and not is_global_admin:
-            reply_func(
-                bot,
-                message,
-                "Глобальный шанс фразы в числовых может менять только глобальный администратор",
-            )
-            return True
-
-        if not is_private_chat and not (is_global_admin or has_chat_admin_rights):
-            reply_func(bot, message, "Только администраторы могут менять шанс фразы в числовых в чате")
-            return True
-
-        payload = _extract_payload(raw_text, "быдлик шанс фразы в числовых")
-        try:
-            value = float(payload.replace("%", "").strip())
-        except ValueError:
-            reply_func(bot, message, "Формат: Быдлик шанс фразы в числовых 50 (в процентах)")
-            return True
-
-        clamped_value = max(0.0, min(100.0, value))
-        target_chat_id = None if is_private_chat else chat_id
-        db.set_question_phrase_chance(clamped_value / 100, target_chat_id)
-        if target_chat_id is None:
-            reply_func(bot, message, f"Глобальный шанс фразы в числовых обновлён до {clamped_value:.2f}%")
-        else:
-            reply_func(bot, message, f"Шанс фразы в числовых в этом чате обновлён до {clamped_value:.2f}%")
+    deleted = ctx.db.delete_question_template(target_chat_id, trigger_text.lower())
+    if not deleted:
+        ctx.reply("Такого вопроса нет")
         return True
 
-    if text.startswith("быдлик шанс фразы в когда"):
-        if is_private_chat and not is_global_admin:
-            reply_func(
-                bot,
-                message,
-                "Глобальный шанс фразы в когда может менять только глобальный администратор",
-            )
-            return True
-
-        if not is_private_chat and not (is_global_admin or has_chat_admin_rights):
-            reply_func(bot, message, "Только администраторы могут менять шанс фразы в когда в чате")
-            return True
-
-        payload = _extract_payload(raw_text, "быдлик шанс фразы в когда")
-        try:
-            value = float(payload.replace("%", "").strip())
-        except ValueError:
-            reply_func(bot, message, "Формат: Быдлик шанс фразы в когда 50 (в процентах)")
-            return True
-
-        clamped_value = max(0.0, min(100.0, value))
-        target_chat_id = None if is_private_chat else chat_id
-        db.set_when_phrase_chance(clamped_value / 100, target_chat_id)
-        if target_chat_id is None:
-            reply_func(bot, message, f"Глобальный шанс фразы в когда обновлён до {clamped_value:.2f}%")
-        else:
-            reply_func(bot, message, f"Шанс фразы в когда в этом чате обновлён до {clamped_value:.2f}%")
-        return True
-
-    if text.startswith("быдлик настройки"):
-        target_chat_id = chat_id if not is_private_chat else None
-        reply_func(bot, message, _build_settings_summary(db, target_chat_id))
-        return True
-
-    if text.startswith("быдлик команды"):
-        reply_func(bot, message, _build_help_message(db, chat_id if not is_private_chat else None))
-        return True
-
-    if text.startswith("быдлик админские команды"):
-        if not (is_global_admin or has_chat_admin_rights):
-            reply_func(bot, message, "Только администраторы могут смотреть админскую справку")
-            return True
-        reply_func(bot, message, _build_admin_help_message())
-        return True
-    if text.startswith("быдлик сколько запросов"):
-        if not is_global_admin:
-            reply_func(bot, message, "Только глобальный администратор может смотреть остаток запросов")
-            return True
-        if llm is None:
-            reply_func(bot, message, "LLM не настроен")
-            return True
-        status = llm.get_tokens_status()
-        if not status:
-            reply_func(bot, message, "Не удалось получить остаток запросов")
-            return True
-        lines = [
-            f"Токенов: {status['total']}",
-            f"Остаток запросов: {status['total_remaining']}",
-        ]
-        reply_func(bot, message, "\n".join(lines))
-        return True
-    if text.startswith("быдлик покажи юзеров"):
-        if is_private_chat:
-            reply_func(bot, message, "Список пользователей доступен только внутри чата")
-            return True
-        if not (is_global_admin or has_chat_admin_rights):
-            reply_func(bot, message, "Только администраторы могут просматривать список пользователей")
-            return True
-
-        chat_users = db.get_chat_users(chat_id)
-        chat_admin_ids = db.get_chat_admin_ids(chat_id)
-        if not chat_users:
-            reply_func(bot, message, "Нет данных о пользователях этого чата")
-            return True
-
-        lines = ["Пользователи и статус тегов:"]
-        for user in chat_users:
-            status = "тегаю" if user.tag else "не тегаю"
-            display_name = user.username or str(user.id)
-            labels = []
-            if user.is_admin:
-                labels.append("глоб. админ")
-            if user.id in chat_admin_ids:
-                labels.append("админ чата")
-            extra = f" ({', '.join(labels)})" if labels else ""
-            lines.append(f"{display_name} — {status}{extra}")
-        reply_func(bot, message, "\n".join(lines))
-        return True
-    if text.startswith("быдлик тегай") or text.startswith("быдлик не тегай"):
-        if text.endswith("тегай меня"):
-            return False
-        if is_private_chat:
-            reply_func(bot, message, "Настройки тегов доступны только в чате")
-            return True
-        if not (is_global_admin or has_chat_admin_rights):
-            reply_func(bot, message, "Только администратор чата может менять теги других пользователей")
-            return True
-
-        if text.startswith("быдлик тегай"):
-            should_tag = True
-            command_prefix = "быдлик тегай"
-        else:
-            should_tag = False
-            command_prefix = "быдлик не тегай"
+    scope = "глобально" if target_chat_id == GLOBAL_CHAT_ID else "для этого чата"
+    ctx.reply(f"Вопрос удалён {scope}")
+    return True
 
-        target_user_id, _ = _extract_target_info(message, raw_text, command_prefix, db)
-        if target_user_id is None:
-            reply_func(
-                bot,
-                message,
-                "Укажи ID, @username или ответь на сообщение после команды 'тегай' или 'не тегай'",
-            )
-            return True
 
-        db.set_tag_status(target_user_id, chat_id, should_tag)
-        target_user = db.get_user(target_user_id, chat_id)
-        target_name = _format_target_name(target_user, target_user_id)
-        status_text = "теперь тегается" if should_tag else "теперь без тегов"
-        reply_func(bot, message, f"{target_name} {status_text}")
+@_ADMIN_COMMANDS.command("быдлик шанс оскорбления")
+def _set_insult_probability(ctx: CommandContext, prefix: str) -> bool:
+    if ctx.is_private_chat and not ctx.is_global_admin:
+        ctx.reply("Глобальный шанс оскорбления может менять только глобальный администратор")
         return True
 
-    if text.startswith("быдлик сделай админом"):
-        if not (is_global_admin or has_chat_admin_rights):
-            reply_func(bot, message, "Только администраторы могут назначать админов")
-            return True
+    if not ctx.is_private_chat and not ctx.is_any_admin:
+        ctx.reply("Только администраторы могут обновлять шанс оскорбления в чате")
+        return True
 
-        target_user_id, _ = _extract_target_info(message, raw_text, "быдлик сделай админом", db)
-        if target_user_id is None:
-            reply_func(
-                bot,
-                message,
-                "Укажи ID, @username или ответь на сообщение: Быдлик сделай админом 123",
-            )
-            return True
+    payload = _extract_payload(ctx.raw_text, prefix)
+    try:
+        value = float(payload.replace("%", "").strip())
+    except ValueError:
+        ctx.reply("Формат: Быдлик шанс оскорбления 5.5 (в процентах)")
+        return True
+
+    clamped_value = max(0.0, min(100.0, value))
+    target_chat_id = None if ctx.is_private_chat else ctx.chat_id
+    ctx.db.set_insult_probability(clamped_value / 100, target_chat_id)
+    if target_chat_id is None:
+        ctx.reply(f"Глобальный шанс оскорбления обновлён до {clamped_value:.2f}%")
+    else:
+        ctx.reply(f"Шанс оскорбления в этом чате обновлён до {clamped_value:.2f}%")
+    return True
 
-        admin_service.add_chat_admin(target_user_id, chat_id)
-        target_user = db.get_user(target_user_id, chat_id)
-        target_name = _format_target_name(target_user, target_user_id)
-        reply_func(bot, message, f"{target_name} теперь администратор этого чата")
+
+@_ADMIN_COMMANDS.command("быдлик уровень оскорблений")
+def _set_insult_level(ctx: CommandContext, prefix: str) -> bool:
+    if ctx.is_private_chat and not ctx.is_global_admin:
+        ctx.reply("Глобальный уровень оскорблений может менять только глобальный администратор")
         return True
 
-    if text.startswith("быдлик убери админа"):
-        if not (is_global_admin or has_chat_admin_rights):
-            reply_func(bot, message, "Только администраторы могут снимать админов")
-            return True
+    if not ctx.is_private_chat and not ctx.is_any_admin:
+        ctx.reply("Только администратор чата может менять уровень оскорблений")
+        return True
 
-        target_user_id, _ = _extract_target_info(message, raw_text, "быдлик убери админа", db)
-        if target_user_id is None:
-            reply_func(
-                bot,
-                message,
-                "Укажи ID, @username или ответь на сообщение: Быдлик убери админа 123",
-            )
-            return True
-        if admin_service.is_admin(target_user_id):
-            reply_func(bot, message, "Глобального администратора нельзя снять с админки")
-            return True
+    payload = _extract_payload(ctx.raw_text, prefix)
+    try:
+        level = int(payload.split()[0])
+    except (ValueError, IndexError):
+        ctx.reply("Формат: Быдлик уровень оскорблений N (1-4)")
+        return True
 
-        admin_service.remove_chat_admin(target_user_id, chat_id)
-        target_user = db.get_user(target_user_id, chat_id)
-        target_name = _format_target_name(target_user, target_user_id)
-        reply_func(bot, message, f"{target_name} больше не администратор этого чата")
+    if level < 1 or level > 4:
+        ctx.reply("Допустимые значения: 1, 2, 3 или 4")
         return True
 
-    if text.startswith("быдлик бан"):
-        if is_private_chat or not (is_global_admin or has_chat_admin_rights):
-            reply_func(bot, message, "Банить можно только в чате и только администраторам")
-            return True
+    target_chat_id = None if ctx.is_private_chat else ctx.chat_id
+    ctx.db.set_insult_level(level, target_chat_id)
+    if target_chat_id is None:
+        ctx.reply(f"Глобальный уровень оскорблений установлен на {level}")
+    else:
+        ctx.reply(f"Уровень оскорблений в этом чате установлен на {level}")
+    return True
 
-        target_user_id, remainder = _extract_target_info(message, raw_text, "быдлик бан", db)
-        if target_user_id is None:
-            reply_func(
-                bot,
-                message,
-                "Укажи ID, @username или ответь на сообщение: Быдлик бан 123 10м",
-            )
-            return True
-        if admin_service.is_admin(target_user_id) or admin_service.is_chat_admin(target_user_id, chat_id):
-            reply_func(bot, message, "Нельзя забанить администратора")
-            return True
-
-        remainder = remainder.lstrip()
-        if remainder.lower().startswith("на "):
-            remainder = remainder[3:].strip()
-        banned_until, duration_error = _parse_duration_to_datetime(remainder)
-        if duration_error:
-            reply_func(bot, message, duration_error)
-            return True
-
-        admin_service.ban_user(target_user_id, chat_id, banned_until)
-        target_user = db.get_user(target_user_id, chat_id)
-        target_name = _format_target_name(target_user, target_user_id)
-        if banned_until:
-            reply_func(
-                bot,
-                message,
-                f"{target_name} забанен до {banned_until.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M UTC')}",
-            )
-        else:
-            reply_func(bot, message, f"{target_name} забанен без срока")
+
+@_ADMIN_COMMANDS.command("быдлик множитель оскорбления")
+def _set_insult_multiplier(ctx: CommandContext, prefix: str) -> bool:
+    if ctx.is_private_chat and not ctx.is_global_admin:
+        ctx.reply("Глобальный множитель оскорбления может менять только глобальный администратор")
         return True
 
-    if text.startswith("быдлик разбан"):
-        if is_private_chat or not (is_global_admin or has_chat_admin_rights):
-            reply_func(bot, message, "Разбанить можно только в чате и только администраторам")
-            return True
+    if not ctx.is_private_chat and not ctx.is_any_admin:
+        ctx.reply("Только администратор чата может менять множитель в этом чате")
+        return True
 
-        target_user_id, _ = _extract_target_info(message, raw_text, "быдлик разбан", db)
-        if target_user_id is None:
-            reply_func(
-                bot,
-                message,
-                "Укажи ID, @username или ответь на сообщение: Быдлик разбан 123",
-            )
-            return True
+    payload = _extract_payload(ctx.raw_text, prefix)
+    try:
+        value = float(payload.strip())
+    except ValueError:
+        ctx.reply("Формат: Быдлик множитель оскорбления 2 (минимум 1)")
+        return True
+
+    clamped_value = max(1.0, value)
+    target_chat_id = None if ctx.is_private_chat else ctx.chat_id
+    ctx.db.set_insult_boost_multiplier(clamped_value, target_chat_id)
+    if target_chat_id is None:
+        ctx.reply(f"Глобальный множитель оскорбления обновлён до {clamped_value:.2f}")
+    else:
+        ctx.reply(f"Множитель оскорбления в этом чате обновлён до {clamped_value:.2f}")
+    return True
+
+
+@_ADMIN_COMMANDS.command("быдлик шанс фразы в числовых")
+def _set_question_phrase_chance(ctx: CommandContext, prefix: str) -> bool:
+    if ctx.is_private_chat and not ctx.is_global_admin:
+        ctx.reply("Глобальный шанс фразы в числовых может менять только глобальный администратор")
+        return True
+
+    if not ctx.is_private_chat and not ctx.is_any_admin:
+        ctx.reply("Только администраторы могут менять шанс фразы в числовых в чате")
+        return True
+
+    payload = _extract_payload(ctx.raw_text, prefix)
+    try:
+        value = float(payload.replace("%", "").strip())
+    except ValueError:
+        ctx.reply("Формат: Быдлик шанс фразы в числовых 50 (в процентах)")
+        return True
+
+    clamped_value = max(0.0, min(100.0, value))
+    target_chat_id = None if ctx.is_private_chat else ctx.chat_id
+    ctx.db.set_question_phrase_chance(clamped_value / 100, target_chat_id)
+    if target_chat_id is None:
+        ctx.reply(f"Глобальный шанс фразы в числовых обновлён до {clamped_value:.2f}%")
+    else:
+        ctx.reply(f"Шанс фразы в числовых в этом чате обновлён до {clamped_value:.2f}%")
+    return True
+
+
+@_ADMIN_COMMANDS.command("быдлик шанс фразы в когда")
+def _set_when_phrase_chance(ctx: CommandContext, prefix: str) -> bool:
+    if ctx.is_private_chat and not ctx.is_global_admin:
+        ctx.reply("Глобальный шанс фразы в когда может менять только глобальный администратор")
+        return True
+
+    if not ctx.is_private_chat and not ctx.is_any_admin:
+        ctx.reply("Только администраторы могут менять шанс фразы в когда в чате")
+        return True
+
+    payload = _extract_payload(ctx.raw_text, prefix)
+    try:
+        value = float(payload.replace("%", "").strip())
+    except ValueError:
+        ctx.reply("Формат: Быдлик шанс фразы в когда 50 (в процентах)")
+        return True
+
+    clamped_value = max(0.0, min(100.0, value))
+    target_chat_id = None if ctx.is_private_chat else ctx.chat_id
+    ctx.db.set_when_phrase_chance(clamped_value / 100, target_chat_id)
+    if target_chat_id is None:
+        ctx.reply(f"Глобальный шанс фразы в когда обновлён до {clamped_value:.2f}%")
+    else:
+        ctx.reply(f"Шанс фразы в когда в этом чате обновлён до {clamped_value:.2f}%")
+    return True
+
+
+@_ADMIN_COMMANDS.command("быдлик настройки")
+def _show_settings(ctx: CommandContext, prefix: str) -> bool:
+    target_chat_id = ctx.chat_id if not ctx.is_private_chat else None
+    ctx.reply(_build_settings_summary(ctx.db, target_chat_id))
+    return True
+
+
+@_ADMIN_COMMANDS.command("быдлик команды")
+def _show_help(ctx: CommandContext, prefix: str) -> bool:
+    ctx.reply(_build_help_message(ctx.db, ctx.chat_id if not ctx.is_private_chat else None))
+    return True
+
+
+@_ADMIN_COMMANDS.command("быдлик админские команды")
+def _show_admin_help(ctx: CommandContext, prefix: str) -> bool:
+    if not ctx.is_any_admin:
+        ctx.reply("Только администраторы могут смотреть админскую справку")
+        return True
+    ctx.reply(_build_admin_help_message())
+    return True
+
+
+@_ADMIN_COMMANDS.command("быдлик сколько запросов")
+def _show_tokens_status(ctx: CommandContext, prefix: str) -> bool:
+    if not ctx.is_global_admin:
+        ctx.reply("Только глобальный администратор может смотреть остаток запросов")
+        return True
+    if ctx.llm is None:
+        ctx.reply("LLM не настроен")
+        return True
+    status = ctx.llm.get_tokens_status()
+    if not status:
+        ctx.reply("Не удалось получить остаток запросов")
+        return True
+    lines = [
+        f"Токенов: {status['total']}",
+        f"Остаток запросов: {status['total_remaining']}",
+    ]
+    ctx.reply("\n".join(lines))
+    return True
+
+
+@_ADMIN_COMMANDS.command("быдлик метрики")
+def _show_metrics(ctx: CommandContext, prefix: str) -> bool:
+    if not ctx.is_global_admin:
+        ctx.reply("Только глобальный администратор может смотреть метрики")
+        return True
+    ctx.reply(format_metrics(metrics.snapshot()))
+    return True
+
+
+@_ADMIN_COMMANDS.command("быдлик покажи юзеров")
+def _show_users(ctx: CommandContext, prefix: str) -> bool:
+    if ctx.is_private_chat:
+        ctx.reply("Список пользователей доступен только внутри чата")
+        return True
+    if not ctx.is_any_admin:
+        ctx.reply("Только администраторы могут просматривать список пользователей")
+        return True
+
+    chat_users = ctx.db.get_chat_users(ctx.chat_id)
+    chat_admin_ids = ctx.db.get_chat_admin_ids(ctx.chat_id)
+    if not chat_users:
+        ctx.reply("Нет данных о пользователях этого чата")
+        return True
+
+    lines = ["Пользователи и статус тегов:"]
+    for user in chat_users:
+        status = "тегаю" if user.tag else "не тегаю"
+        display_name = user.username or str(user.id)
+        labels = []
+        if user.is_admin:
+            labels.append("глоб. админ")
+        if user.id in chat_admin_ids:
+            labels.append("админ чата")
+        extra = f" ({', '.join(labels)})" if labels else ""
+        lines.append(f"{display_name} — {status}{extra}")
+    ctx.reply("\n".join(lines))
+    return True
+
+
+@_ADMIN_COMMANDS.command("быдлик тегай", "быдлик не тегай")
+def _set_tag_status(ctx: CommandContext, prefix: str) -> bool:
+    if ctx.text.endswith("тегай меня"):
+        return False
+    if ctx.is_private_chat:
+        ctx.reply("Настройки тегов доступны только в чате")
+        return True
+    if not ctx.is_any_admin:
+        ctx.reply("Только администратор чата может менять теги других пользователей")
+        return True
+
+    should_tag = prefix == "быдлик тегай"
+    target_user_id, _ = _extract_target_info(ctx.message, ctx.raw_text, prefix, ctx.db)
+    if target_user_id is None:
+        ctx.reply("Укажи ID, @username или ответь на сообщение после команды 'тегай' или 'не тегай'")
+        return True
+
+    ctx.db.set_tag_status(target_user_id, ctx.chat_id, should_tag)
+    target_user = ctx.db.get_user(target_user_id, ctx.chat_id)
+    target_name = _format_target_name(target_user, target_user_id)
+    status_text = "теперь тегается" if should_tag else "теперь без тегов"
+    ctx.reply(f"{target_name} {status_text}")
+    return True
+
+
+@_ADMIN_COMMANDS.command("быдлик вес")
+def _set_user_weight(ctx: CommandContext, prefix: str) -> bool:
+    if ctx.is_private_chat:
+        ctx.reply("Вес пользователей настраивается только в чате")
+        return True
+    if not ctx.is_any_admin:
+        ctx.reply("Только администратор чата может менять вес пользователей")
+        return True
+
+    target_user_id, remainder = _extract_target_info(ctx.message, ctx.raw_text, prefix, ctx.db)
+    try:
+        weight = float(remainder.split()[0].replace(",", "."))
+    except (ValueError, IndexError):
+        weight = None
+    if target_user_id is None or weight is None or not math.isfinite(weight):
+        ctx.reply(
+            "Укажи ID, @username или ответь на сообщение: Быдлик вес @user 2 "
+            f"(1 — обычный, 0 — никогда, максимум {MAX_USER_WEIGHT:g})"
+        )
+        return True
+
+    capped = weight > MAX_USER_WEIGHT
+    weight = min(MAX_USER_WEIGHT, max(0.0, weight))
+    ctx.db.set_user_weight(target_user_id, ctx.chat_id, weight)
+    target_user = ctx.db.get_user(target_user_id, ctx.chat_id)
+    target_name = _format_target_name(target_user, target_user_id)
+    suffix = f" (больше {MAX_USER_WEIGHT:g} нельзя)" if capped else ""
+    ctx.reply(f"Вес {target_name} в выборе пользователя теперь {weight:g}{suffix}")
+    return True
+
+
+@_ADMIN_COMMANDS.command("быдлик сделай админом")
+def _make_admin(ctx: CommandContext, prefix: str) -> bool:
+    if not ctx.is_any_admin:
+        ctx.reply("Только администраторы могут назначать админов")
+        return True
+
+    target_user_id, _ = _extract_target_info(ctx.message, ctx.raw_text, prefix, ctx.db)
+    if target_user_id is None:
+        ctx.reply("Укажи ID, @username или ответь на сообщение: Быдлик сделай админом 123")
+        return True
+
+    ctx.admin_service.add_chat_admin(target_user_id, ctx.chat_id)
+    target_user = ctx.db.get_user(target_user_id, ctx.chat_id)
+    target_name = _format_target_name(target_user, target_user_id)
+    ctx.reply(f"{target_name} теперь администратор этого чата")
+    return True
+
+
+@_ADMIN_COMMANDS.command("быдлик убери админа")
+def _remove_admin(ctx: CommandContext, prefix: str) -> bool:
+    if not ctx.is_any_admin:
+        ctx.reply("Только администраторы могут снимать админов")
+        return True
+
+    target_user_id, _ = _extract_target_info(ctx.message, ctx.raw_text, prefix, ctx.db)
+    if target_user_id is None:
+        ctx.reply("Укажи ID, @username или ответь на сообщение: Быдлик убери админа 123")
+        return True
+    if ctx.admin_service.is_admin(target_user_id):
+        ctx.reply("Глобального администратора нельзя снять с админки")
+        return True
+
+    ctx.admin_service.remove_chat_admin(target_user_id, ctx.chat_id)
+    target_user = ctx.db.get_user(target_user_id, ctx.chat_id)
+    target_name = _format_target_name(target_user, target_user_id)
+    ctx.reply(f"{target_name} больше не администратор этого чата")
+    return True
+
+
+@_ADMIN_COMMANDS.command("быдлик бан")
+def _ban_user(ctx: CommandContext, prefix: str) -> bool:
+    if ctx.is_private_chat or not ctx.is_any_admin:
+        ctx.reply("Банить можно только в чате и только администраторам")
+        return True
+
+    target_user_id, remainder = _extract_target_info(ctx.message, ctx.raw_text, prefix, ctx.db)
+    if target_user_id is None:
+        ctx.reply("Укажи ID, @username или ответь на сообщение: Быдлик бан 123 10м")
+        return True
+    if ctx.admin_service.is_admin(target_user_id) or ctx.admin_service.is_chat_admin(target_user_id, ctx.chat_id):
+        ctx.reply("Нельзя забанить администратора")
+        return True
+
+    remainder = remainder.lstrip()
+    if remainder.lower().startswith("на "):
+        remainder = remainder[3:].strip()
+    banned_until, duration_error = _parse_duration_to_datetime(remainder)
+    if duration_error:
+        ctx.reply(duration_error)
+        return True
+
+    ctx.admin_service.ban_user(target_user_id, ctx.chat_id, banned_until)
+    target_user = ctx.db.get_user(target_user_id, ctx.chat_id)
+    target_name = _format_target_name(target_user, target_user_id)
+    if banned_until:
+        ctx.reply(
+            f"{target_name} забанен до {banned_until.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M UTC')}"
+        )
+    else:
+        ctx.reply(f"{target_name} забанен без срока")
+    return True
 
-        admin_service.unban_user(target_user_id, chat_id)
-        target_user = db.get_user(target_user_id, chat_id)
-        target_name = _format_target_name(target_user, target_user_id)
-        reply_func(bot, message, f"{target_name} разбанен")
+
+@_ADMIN_COMMANDS.command("быдлик разбан")
+def _unban_user(ctx: CommandContext, prefix: str) -> bool:
+    if ctx.is_private_chat or not ctx.is_any_admin:
+        ctx.reply("Разбанить можно только в чате и только администраторам")
+        return True
+
+    target_user_id, _ = _extract_target_info(ctx.message, ctx.raw_text, prefix, ctx.db)
+    if target_user_id is None:
+        ctx.reply("Укажи ID, @username или ответь на сообщение: Быдлик разбан 123")
         return True
 
-    return False
+    ctx.admin_service.unban_user(target_user_id, ctx.chat_id)
+    target_user = ctx.db.get_user(target_user_id, ctx.chat_id)
+    target_name = _format_target_name(target_user, target_user_id)
+    ctx.reply(f"{target_name} разбанен")
+    return True
+
+
+@_CHAT_PHRASES.phrase("быдлик не тегай меня")
+def _disable_own_tag(ctx: CommandContext) -> None:
+    tag_status = ctx.db.get_tag_status(ctx.user_id, ctx.chat_id)
+    if tag_status:
+        ctx.db.set_tag_status(ctx.user_id, ctx.chat_id, False)
+        ctx.reply('Готово\nЕсли захочешь, чтобы я снова тебя тегал, просто напиши мне "Быдлик тегай меня"')
+    else:
+        ctx.reply("Ты уже просил, я тебя не тегаю")
+
+
+@_CHAT_PHRASES.phrase("быдлик тегай меня")
+def _enable_own_tag(ctx: CommandContext) -> None:
+    tag_status = ctx.db.get_tag_status(ctx.user_id, ctx.chat_id)
+    if not tag_status:
+        ctx.db.set_tag_status(ctx.user_id, ctx.chat_id, True)
+        ctx.reply('Готово\nЕсли захочешь, чтобы я перестал тебя тегать, просто напиши мне "Быдлик не тегай меня"')
+    else:
+        ctx.reply("Я тебя и так тегаю")
+
+
+@_CHAT_PHRASES.phrase("быдлик насколько")
+def _answer_how_much(ctx: CommandContext) -> None:
+    que_s = ctx.text.split("насколько", 1)
+    que = que_s[1]
+    seed = generate_seed(que, ctx.user_id)
+    random.seed(int(seed))
+    result = str(random.randrange(1, 100) + 1)
+    ctx.reply("На" + " " + result + "%")
+
+
+@_CHAT_PHRASES.phrase("быдлик когда")
+def _answer_when(ctx: CommandContext) -> None:
+    when_phrase_chance = ctx.db.get_effective_settings(ctx.settings_scope).when_phrase_chance
+    if random.random() < when_phrase_chance:
+        result = random.choice(FLEXIBLE_TIME_RESPONSES)
+    else:
+        date_choice = random.choice(TIME_UNIT_OPTIONS)
+        numbers = random.randrange(1, 100)
+        result = when(date_choice, numbers)
+    ctx.reply(result)
+
+
+@_CHAT_PHRASES.phrase("быдлик ", " или ")
+def _answer_either(ctx: CommandContext) -> None:
+    que_s = ctx.text.split("быдлик", 1)[1].split(" или ")
+    if not que_s[0].strip():
+        que_s = que_s[1:]
+    result = random.choice(que_s)
+    ctx.reply(result)
 
 
 def _extract_payload(raw_text: str, command_prefix: str) -> str:
@@ -740,13 +901,26 @@ def _describe_non_text_message(message) -> str:
     return mapping.get(message.content_type, f"[{message.content_type}]")
 
 
-def _ensure_chat_owner_admin(bot: TeleBot, chat_id: int, user_id: int, admin_service: AdminService) -> None:
+def _ensure_chat_owner_admin(
+    bot: TeleBot,
+    chat_id: int,
+    user_id: int,
+    admin_service: AdminService,
+    member_statuses: MemberStatusCache,
+) -> None:
+    hit, _ = member_statuses.lookup(chat_id, user_id)
+    if hit:
+        return
+
     try:
         member = bot.get_chat_member(chat_id, user_id)
     except ApiTelegramException:
+        member_statuses.store(chat_id, user_id, None)
         return
 
-    if getattr(member, "status", None) == "creator":
+    status = getattr(member, "status", None)
+    member_statuses.store(chat_id, user_id, status)
+    if status == "creator":
         admin_service.add_chat_admin(user_id, chat_id)
 
 
@@ -833,29 +1007,6 @@ def _build_settings_summary(db: Database, chat_id: Optional[int]) -> str:
     return "\n".join(lines)
 
 
-def _download_photo_base64(bot: TeleBot, message) -> Tuple[Optional[str], str]:
-    """Download the largest photo from a Telegram message and return (base64, mime_type)."""
-    try:
-        photos = message.photo
-        if not photos:
-            return None, "image/jpeg"
-        # Pick the highest-resolution photo (last in the array)
-        best_photo = photos[-1]
-        file_info = bot.get_file(best_photo.file_id)
-        file_bytes = bot.download_file(file_info.file_path)
-        b64 = base64.b64encode(file_bytes).decode("utf-8")
-        # Determine mime from file extension
-        mime = "image/jpeg"
-        if file_info.file_path and file_info.file_path.lower().endswith(".png"):
-            mime = "image/png"
-        elif file_info.file_path and file_info.file_path.lower().endswith(".webp"):
-            mime = "image/webp"
-        return b64, mime
-    except Exception as exc:
-        print(f"Failed to download photo: {exc}")
-        return None, "image/jpeg"
-
-
 def _build_admin_help_message() -> str:
     commands = [
         "Быдлик добавь вопрос триггер|ответ — добавить вопрос (локально в чате). Используй {mention}, {question}, {number}, {percent}",
@@ -866,10 +1017,12 @@ def _build_admin_help_message() -> str:
         "Быдлик шанс фразы в числовых X — шанс фразы вместо числа (глобально в личке, локально в чате)",
         "Быдлик шанс фразы в когда X — шанс фразы вместо даты (глобально в личке, локально в чате)",
         "Быдлик сколько запросов — остаток запросов к LLM",
+        "Быдлик метрики — внутренние счётчики (ожидание блокировок БД и т. п.)",
         "Быдлик сделай админом @user / Быдлик убери админа @user",
         "Быдлик бан @user 10м / Быдлик разбан @user",
         "Быдлик покажи юзеров — список пользователей/тегов",
         "Быдлик тегай @user / Быдлик не тегай @user — изменить тег другого пользователя",
+        f"Быдлик вес @user N — как часто пользователь выпадает в вопросах (1 — обычно, 0 — никогда, до {MAX_USER_WEIGHT:g})",
         "Быдлик админские команды — эта справка",
     ]
     return "Админские команды:\n" + "\n".join(commands)
@@ -0,0 +1,66 @@
+import time
+
+from app.metrics import metrics
+
+# Consecutive failed or blocked calls that open a provider's circuit
+BREAKER_FAILURE_THRESHOLD = 3
+# Seconds an open circuit skips the provider before letting one trial call through
+BREAKER_COOLDOWN = 30.0
+
+
+class CircuitBreaker:
+    """Per-provider circuit: closed -> open after failures -> half-open after a cooldown.
+
+    While open, ``allow`` is False and the provider is skipped without a
+    request. After ``cooldown`` seconds one trial call is let through; its
+    success closes the circuit, its failure opens it for another cooldown.
+    Only used from the LLM loop thread, so it needs no lock.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        cooldown: float = BREAKER_COOLDOWN,
+    ) -> None:
+        self.name = name
+        self._failure_threshold = max(1, failure_threshold)
+        self._cooldown = cooldown
+        self._failures = 0
+        self._opened_at: float = 0.0
+        self._open = False
+        self._probing = False
+
+    @property
+    def is_open(self) -> bool:
+        return self._open
+
+    def allow(self) -> bool:
+        if not self._open:
+            return True
+        if self._probing or time.monotonic() - self._opened_at < self._cooldown:
+            return False
+        self._probing = True
+        print(f"  {self.name}: circuit half-open, trying one call")
+        return True
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._probing = False
+        if self._open:
+            self._open = False
+            print(f"  {self.name}: circuit closed")
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._open or self._failures >= self._failure_threshold:
+            if not self._open:
+                metrics.inc("llm.breaker_opened")
+            self._open = True
+            self._probing = False
+            self._opened_at = time.monotonic()
+            print(f"  {self.name}: circuit open for {self._cooldown:.0f}s after {self._failures} failures")
+
+    def record_cancelled(self) -> None:
+        """The call was abandoned by the caller; it says nothing about the provider."""
+        self._probing = False
@@ -0,0 +1,84 @@
+import threading
+
+from collections import OrderedDict
+from typing import Callable, Generic, Hashable, Optional, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class LRUCache(Generic[K, V]):
+    """Thread-safe bounded mapping that evicts the least recently used key."""
+
+    def __init__(self, maxsize: int) -> None:
+        self._maxsize = max(1, maxsize)
+        self._data: "OrderedDict[K, V]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key: K, value: V) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self._maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def __contains__(self, key: object) -> bool:
+        with self._lock:
+            return key in self._data
+
+
+class LoadingCache(Generic[K, V]):
+    """LRU cache that fills misses from ``loader``.
+
+    Invalidation bumps a generation counter, so a load that started before an
+    invalidation is returned to its caller but never stored.
+    """
+
+    def __init__(self, maxsize: int, loader: Callable[[K], V]) -> None:
+        self._loader = loader
+        self._cache: LRUCache[K, V] = LRUCache(maxsize)
+        self._lock = threading.Lock()
+        self._generation = 0
+
+    def get(self, key: K) -> V:
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+
+        generation = self._generation
+        value = self._loader(key)
+        with self._lock:
+            if generation == self._generation:
+                self._cache.put(key, value)
+        return value
+
+    def invalidate(self, key: K) -> None:
+        with self._lock:
+            self._generation += 1
+            self._cache.pop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._cache.clear()
@@ -0,0 +1,156 @@
+from functools import cached_property
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.matcher import PatternMatcher
+
+
+class CommandContext:
+    """Everything a command handler needs about the incoming message.
+
+    Permission checks hit the database, so they are computed on first access
+    only, i.e. when a privileged command actually matched.
+    """
+
+    def __init__(
+        self,
+        bot,
+        message,
+        text: str,
+        raw_text: str,
+        user_id: int,
+        chat_id: int,
+        db,
+        admin_service,
+        llm=None,
+        reply_func=None,
+    ) -> None:
+        self.bot = bot
+        self.message = message
+        self.text = text
+        self.raw_text = raw_text
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.db = db
+        self.admin_service = admin_service
+        self.llm = llm
+        self.reply_func = reply_func
+        self.is_private_chat = getattr(message.chat, "type", "") == "private"
+
+    @cached_property
+    def is_global_admin(self) -> bool:
+        return self.admin_service.is_admin(self.user_id)
+
+    @cached_property
+    def has_chat_admin_rights(self) -> bool:
+        if self.is_private_chat:
+            return False
+        return self.admin_service.is_chat_admin(self.user_id, self.chat_id)
+
+    @property
+    def is_any_admin(self) -> bool:
+        return self.is_global_admin or self.has_chat_admin_rights
+
+    @property
+    def settings_scope(self) -> Optional[int]:
+        return None if self.is_private_chat else self.chat_id
+
+    def reply(self, text: str) -> None:
+        self.reply_func(self.bot, self.message, text)
+
+
+# handler(ctx, matched_prefix) -> whether the message was handled
+CommandHandler = Callable[[CommandContext, str], bool]
+_TERMINAL = ""
+
+
+class CommandRouter:
+    """Prefix-trie dispatch for commands that must start the message.
+
+    Resolving walks the trie once along the text. When several registered
+    prefixes match, the one registered first wins, like a ``startswith`` chain.
+    """
+
+    def __init__(self) -> None:
+        self._root: Dict[str, dict] = {}
+        self._order = 0
+
+    def command(self, *prefixes: str) -> Callable[[CommandHandler], CommandHandler]:
+        def register(handler: CommandHandler) -> CommandHandler:
+            for prefix in prefixes:
+                node = self._root
+                for char in prefix:
+                    node = node.setdefault(char, {})
+                node.setdefault(_TERMINAL, (self._order, prefix, handler))
+                self._order += 1
+            return handler
+
+        return register
+
+    def resolve(self, text: str) -> Optional[Tuple[str, CommandHandler]]:
+        best = None
+        node = self._root
+        for char in text:
+            node = node.get(char)
+            if node is None:
+                break
+            terminal = node.get(_TERMINAL)
+            if terminal is not None and (best is None or terminal[0] < best[0]):
+                best = terminal
+        if best is None:
+            return None
+        return best[1], best[2]
+
+    def dispatch(self, ctx: CommandContext) -> bool:
+        resolved = self.resolve(ctx.text)
+        if resolved is None:
+            return False
+        prefix, handler = resolved
+        return handler(ctx, prefix)
+
+
+# handler(ctx) for phrase rules; a matched rule always counts as handled
+PhraseHandler = Callable[[CommandContext], None]
+
+
+class PhraseRouter:
+    """Dispatch for rules whose phrases may appear anywhere in the text.
+
+    A rule matches when all of its phrases occur; the first registered match
+    wins. All phrases are found in a single automaton pass.
+    """
+
+    def __init__(self) -> None:
+        self._rules: List[Tuple[Tuple[int, ...], PhraseHandler]] = []
+        self._phrases: List[str] = []
+        self._matcher: Optional[PatternMatcher] = None
+
+    def phrase(self, *phrases: str) -> Callable[[PhraseHandler], PhraseHandler]:
+        def register(handler: PhraseHandler) -> PhraseHandler:
+            indices = []
+            for phrase in phrases:
+                if phrase not in self._phrases:
+                    self._phrases.append(phrase)
+                indices.append(self._phrases.index(phrase))
+            self._rules.append((tuple(indices), handler))
+            self._matcher = None
+            return handler
+
+        return register
+
+    def resolve(self, text: str) -> Optional[PhraseHandler]:
+        if self._matcher is None:
+            self._matcher = PatternMatcher(self._phrases)
+        found = self._matcher.find_all(text)
+        if not found:
+            return None
+        for indices, handler in self._rules:
+            if all(index in found for index in indices):
+                return handler
+        return None
+
+    def dispatch(self, ctx: CommandContext) -> bool:
+        handler = self.resolve(ctx.text)
+        if handler is None:
+            return False
+        handler(ctx)
+        return True
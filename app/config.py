@@ -11,15 +11,42 @@ class LLMConfig:
     api_key: str
     model: str
     supports_images: bool = False
+    # Photo budget for vision calls; 0 = no limit (see app.media.ImageBudget)
+    image_max_side: int = 0
+    image_max_bytes: int = 0
+    # Per-request limits for this provider; retries are the client library's own
+    connect_timeout: float = 5.0
+    read_timeout: float = 30.0
+    max_retries: int = 0
 
 @dataclass
 class Settings:
     token: str
     database_path: str
+    database_read_pool_size: int = 4
     llm_configs: List[LLMConfig] = field(default_factory=list)
     llm_image_config: Optional[LLMConfig] = None
     llm_tokens_username: str = ""
     llm_tokens_password: str = ""
+    llm_max_concurrency: int = 4
+    llm_max_pending: int = 16
+    llm_reply_timeout: float = 60.0
+    llm_breaker_failures: int = 3
+    llm_breaker_cooldown: float = 30.0
+    llm_hedging: bool = False
+    llm_hedge_delay: float = 5.0
+    llm_exploration: float = 0.05
+    llm_streaming: bool = True
+    llm_max_reply_sentences: int = 3
+    llm_max_reply_chars: int = 600
+    handler_workers: int = 8
+    shards: int = 1
+    describe_images: bool = True
+    webhook_url: str = ""
+    webhook_listen: str = "0.0.0.0"
+    webhook_port: int = 8080
+    webhook_secret: str = ""
+    webhook_queue_size: int = 1000
 
 
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.dirname(__file__)), ".env"))
@@ -43,6 +70,11 @@ def _load_llm_configs() -> List[LLMConfig]:
             api_key=api_key or "unused",
             model=model or "grok-3-fast",
             supports_images=supports_images,
+            image_max_side=int(os.environ.get(f"LLM_MAX_IMAGE_SIDE_{idx}", "0")),
+            image_max_bytes=int(os.environ.get(f"LLM_MAX_IMAGE_BYTES_{idx}", "0")),
+            connect_timeout=float(os.environ.get(f"LLM_CONNECT_TIMEOUT_{idx}", "5")),
+            read_timeout=float(os.environ.get(f"LLM_READ_TIMEOUT_{idx}", "30")),
+            max_retries=int(os.environ.get(f"LLM_MAX_RETRIES_{idx}", "0")),
         ))
 
     if not configs:
@@ -55,6 +87,11 @@ def _load_llm_configs() -> List[LLMConfig]:
             api_key=api_key,
             model=model,
             supports_images=supports_images,
+            image_max_side=int(os.environ.get("LLM_MAX_IMAGE_SIDE", "0")),
+            image_max_bytes=int(os.environ.get("LLM_MAX_IMAGE_BYTES", "0")),
+            connect_timeout=float(os.environ.get("LLM_CONNECT_TIMEOUT", "5")),
+            read_timeout=float(os.environ.get("LLM_READ_TIMEOUT", "30")),
+            max_retries=int(os.environ.get("LLM_MAX_RETRIES", "0")),
         ))
 
     return configs
@@ -65,14 +102,44 @@ def _load_image_llm_config() -> Optional[LLMConfig]:
         return None
     api_key = os.environ.get("LLM_IMAGE_API_KEY", "unused")
     model = os.environ.get("LLM_IMAGE_MODEL", "grok-3-fast")
-    return LLMConfig(base_url=base_url, api_key=api_key, model=model, supports_images=True)
+    return LLMConfig(
+        base_url=base_url,
+        api_key=api_key,
+        model=model,
+        supports_images=True,
+        image_max_side=int(os.environ.get("LLM_IMAGE_MAX_SIDE", "0")),
+        image_max_bytes=int(os.environ.get("LLM_IMAGE_MAX_BYTES", "0")),
+        connect_timeout=float(os.environ.get("LLM_IMAGE_CONNECT_TIMEOUT", "5")),
+        read_timeout=float(os.environ.get("LLM_IMAGE_READ_TIMEOUT", "15")),
+        max_retries=int(os.environ.get("LLM_IMAGE_MAX_RETRIES", "0")),
+    )
 
 def load_settings() -> Settings:
     return Settings(
         token=os.environ["TOKEN"],
         database_path=os.environ.get("DATABASE_PATH", "bidlik.db"),
+        database_read_pool_size=int(os.environ.get("DATABASE_READ_POOL_SIZE", "4")),
         llm_configs=_load_llm_configs(),
         llm_image_config=_load_image_llm_config(),
         llm_tokens_username=os.environ.get("LLM_TOKENS_USERNAME", ""),
         llm_tokens_password=os.environ.get("LLM_TOKENS_PASSWORD", ""),
+        llm_max_concurrency=int(os.environ.get("LLM_MAX_CONCURRENCY", "4")),
+        llm_max_pending=int(os.environ.get("LLM_MAX_PENDING", "16")),
+        llm_reply_timeout=float(os.environ.get("LLM_REPLY_TIMEOUT", "60")),
+        llm_breaker_failures=int(os.environ.get("LLM_BREAKER_FAILURES", "3")),
+        llm_breaker_cooldown=float(os.environ.get("LLM_BREAKER_COOLDOWN", "30")),
+        llm_hedging=os.environ.get("LLM_HEDGING", "false").lower() in ("true", "1", "yes"),
+        llm_hedge_delay=float(os.environ.get("LLM_HEDGE_DELAY", "5")),
+        llm_exploration=float(os.environ.get("LLM_EXPLORATION", "0.05")),
+        llm_streaming=os.environ.get("LLM_STREAMING", "true").lower() in ("true", "1", "yes"),
+        llm_max_reply_sentences=int(os.environ.get("LLM_MAX_REPLY_SENTENCES", "3")),
+        llm_max_reply_chars=int(os.environ.get("LLM_MAX_REPLY_CHARS", "600")),
+        handler_workers=int(os.environ.get("HANDLER_WORKERS", "8")),
+        shards=int(os.environ.get("SHARDS", "1")),
+        describe_images=os.environ.get("DESCRIBE_IMAGES", "true").lower() in ("true", "1", "yes"),
+        webhook_url=os.environ.get("WEBHOOK_URL", ""),
+        webhook_listen=os.environ.get("WEBHOOK_LISTEN", "0.0.0.0"),
+        webhook_port=int(os.environ.get("WEBHOOK_PORT", "8080")),
+        webhook_secret=os.environ.get("WEBHOOK_SECRET", ""),
+        webhook_queue_size=int(os.environ.get("WEBHOOK_QUEUE_SIZE", "1000")),
     )
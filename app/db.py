@@ -1,9 +1,19 @@
+from concurrent.futures import Future
+from contextlib import contextmanager
 from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import List, Optional, Sequence, Tuple, Set
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Set, Union
 
+import heapq
+import queue
 import sqlite3
 import threading
+import time
+
+from app.cache import LoadingCache
+from app.matcher import QuestionMatcher
+from app.metrics import metrics
+from app.sampling import AliasSampler
 
 
 GLOBAL_CHAT_ID = 0
@@ -31,6 +41,28 @@ DEFAULT_QUESTION_TEMPLATES = [
     ("чьи", "{mention}'а{question}"),
     ("сколько", "{number}"),
 ]
+# Upper bound on resolved per-chat settings kept in memory
+SETTINGS_CACHE_SIZE = 4096
+# Upper bound on per-chat rosters and compiled question matchers kept in memory
+ROSTER_CACHE_SIZE = 4096
+MATCHER_CACHE_SIZE = 4096
+# Relative odds of picking a tagged member (times their own weight) versus the bot itself
+MEMBER_SELECTION_WEIGHT = 2.0
+# Largest per-user weight; keeps the sampler's total finite and comparable
+MAX_USER_WEIGHT = 100.0
+BOT_SELECTION_WEIGHT = 1.0
+BOT_SELECTION = "bot"
+# Group commit bounds for the writer thread
+WRITE_BATCH_SIZE = 256
+WRITE_BATCH_INTERVAL = 0.05
+# Read-only connections kept next to the single writer connection
+READ_POOL_SIZE = 4
+# Longest the ban sweeper sleeps between checks for expired bans
+BAN_SWEEP_INTERVAL = 60.0
+# Image descriptions are reused for this long before the image is described again
+IMAGE_DESCRIPTION_TTL = 30 * 24 * 3600.0
+# How often cached global settings/templates are checked against changes made by other processes
+GLOBAL_REVISION_CHECK_INTERVAL = 5.0
 
 
 @dataclass
@@ -49,35 +81,378 @@ class QuestionTemplate:
     chat_id: int = GLOBAL_CHAT_ID
 
 
+@dataclass(frozen=True)
+class EffectiveSettings:
+    insult_probability: float
+    insult_level: int
+    insult_boost_multiplier: float
+    question_phrase_chance: float
+    when_phrase_chance: float
+
+
+def _parse_probability(value: str) -> float:
+    return float(value)
+
+
+def _parse_level(value: str) -> int:
+    return int(value)
+
+
+def _parse_multiplier(value: str) -> float:
+    return max(1.0, float(value))
+
+
+def _parse_chance(value: str) -> float:
+    return max(0.0, min(1.0, float(value)))
+
+
+# setting key -> (EffectiveSettings field, parser, default)
+_SETTING_SPECS = {
+    INSULT_PROBABILITY_KEY: ("insult_probability", _parse_probability, DEFAULT_INSULT_PROBABILITY),
+    INSULT_LEVEL_KEY: ("insult_level", _parse_level, DEFAULT_INSULT_LEVEL),
+    INSULT_BOOST_KEY: ("insult_boost_multiplier", _parse_multiplier, DEFAULT_INSULT_BOOST),
+    QUESTION_PHRASE_CHANCE_KEY: ("question_phrase_chance", _parse_chance, DEFAULT_QUESTION_PHRASE_CHANCE),
+    WHEN_PHRASE_CHANCE_KEY: ("when_phrase_chance", _parse_chance, DEFAULT_WHEN_PHRASE_CHANCE),
+}
+
+
+class ChatRoster:
+    """Users known in one chat plus a precomputed sampler over the tagged ones.
+
+    ``sample`` returns a tagged ``UserRecord`` or ``BOT_SELECTION`` in O(1).
+    """
+
+    def __init__(self, rows: Sequence[Sequence]) -> None:
+        # user_id -> username as stored, to tell inserts and renames apart from no-op upserts
+        self.usernames: Dict[int, Optional[str]] = {}
+        self.tagged: List[UserRecord] = []
+        weights: List[float] = []
+        for user_id, username, chat_id, tag, is_admin, weight in rows:
+            self.usernames[user_id] = username
+            if not tag:
+                continue
+            self.tagged.append(Database._map_user((user_id, username, chat_id, tag, is_admin)))
+            # Rows written before the cap may still hold inf or huge values
+            weight = 1.0 if weight is None else min(MAX_USER_WEIGHT, max(0.0, weight))
+            weights.append(MEMBER_SELECTION_WEIGHT * weight)
+        self._sampler: AliasSampler[Union[UserRecord, str]] = AliasSampler(
+            [*self.tagged, BOT_SELECTION],
+            [*weights, BOT_SELECTION_WEIGHT],
+        )
+
+    def sample(self, rng=None) -> Union[UserRecord, str]:
+        return self._sampler.sample(rng)
+
+
+@dataclass
+class _WriteRequest:
+    query: Optional[str]
+    params: Sequence
+    many: bool
+    urgent: bool
+    future: Future
+
+
+class _BatchWriter:
+    """Background thread that applies queued mutations in group commits.
+
+    A batch is closed when it reaches ``batch_size`` statements or when
+    ``batch_interval`` seconds pass since its first statement. Urgent requests
+    (someone is blocked on the result) close the batch as soon as the queue is
+    drained, so synchronous callers never wait for the interval.
+    """
+
+    def __init__(
+        self,
+        connection,
+        lock: threading.Lock,
+        batch_size: int = WRITE_BATCH_SIZE,
+        batch_interval: float = WRITE_BATCH_INTERVAL,
+    ) -> None:
+        self._connection = connection
+        self._lock = lock
+        self._batch_size = batch_size
+        self._batch_interval = batch_interval
+        self._queue: "queue.Queue[Optional[_WriteRequest]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, query: str, params=(), many: bool = False, urgent: bool = True) -> Future:
+        future: Future = Future()
+        self._queue.put(_WriteRequest(query, params, many, urgent, future))
+        return future
+
+    def close(self) -> None:
+        """Commit everything queued so far and stop the thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            urgent = first.urgent
+            deadline = time.monotonic() + self._batch_interval
+            while len(batch) < self._batch_size:
+                try:
+                    if urgent:
+                        request = self._queue.get_nowait()
+                    else:
+                        request = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if request is None:
+                    stopping = True
+                    break
+                batch.append(request)
+                urgent = urgent or request.urgent
+            try:
+                self._apply(batch)
+            except Exception as exc:
+                # The thread must outlive any batch, or every later write would hang
+                print(f"DB writer error: {exc!r}")
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(exc)
+
+    def _apply(self, batch: List[_WriteRequest]) -> None:
+        results = []
+        with _timed_lock(self._lock, "db.write"):
+            for request in batch:
+                try:
+                    if request.many:
+                        cursor = self._connection.executemany(request.query, request.params)
+                    else:
+                        cursor = self._connection.execute(request.query, request.params)
+                    results.append((request, cursor.rowcount, None))
+                except Exception as exc:
+                    # Bad parameters (e.g. an int too large for SQLite) fail only their request
+                    print(f"DB write failed: {exc!r}")
+                    results.append((request, None, exc))
+            try:
+                self._connection.commit()
+            except Exception as exc:
+                print(f"DB commit failed: {exc!r}")
+                try:
+                    self._connection.rollback()
+                except Exception as rollback_exc:
+                    print(f"DB rollback failed: {rollback_exc!r}")
+                results = [(request, None, exc) for request, _, _ in results]
+
+        for request, rowcount, error in results:
+            if error is not None:
+                request.future.set_exception(error)
+            else:
+                request.future.set_result(rowcount)
+
+
+@contextmanager
+def _timed_lock(lock: threading.Lock, metric: str) -> Iterator[None]:
+    """Hold ``lock`` and record how long it took to get it under ``metric``."""
+    started = time.perf_counter()
+    with lock:
+        metrics.inc(f"{metric}_wait_seconds", time.perf_counter() - started)
+        metrics.inc(f"{metric}_acquisitions")
+        yield
+
+
+class _ReaderPool:
+    """Checkout pool of read-only connections.
+
+    In WAL mode these read concurrently with each other and with the writer
+    connection. Connections are opened lazily up to ``size``; when all are
+    checked out, callers wait for one to be returned.
+    """
+
+    def __init__(self, factory: Callable[[], sqlite3.Connection], size: int = READ_POOL_SIZE) -> None:
+        self._factory = factory
+        self._size = max(1, size)
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._opened: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        started = time.perf_counter()
+        connection = self._acquire()
+        metrics.inc("db.read_wait_seconds", time.perf_counter() - started)
+        metrics.inc("db.read_acquisitions")
+        try:
+            yield connection
+        finally:
+            self._idle.put(connection)
+
+    def close(self) -> None:
+        with self._lock:
+            for connection in self._opened:
+                connection.close()
+            self._opened.clear()
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._opened) < self._size:
+                connection = self._factory()
+                self._opened.append(connection)
+                return connection
+        return self._idle.get()
+
+
+class _BanIndex:
+    """In-memory view of ``chat_bans`` with a min-heap of expiry times.
+
+    Entries map (user_id, chat_id) to (expires_at, raw_value); ``expires_at`` is
+    a UNIX timestamp or None for a permanent ban and ``raw_value`` is the stored
+    ``banned_until`` text. Heap entries are removed lazily: an entry whose value
+    no longer matches the map is skipped when popped.
+    """
+
+    def __init__(self) -> None:
+        self._bans: Dict[Tuple[int, int], Tuple[Optional[float], Optional[str]]] = {}
+        self._expiries: List[Tuple[float, int, int, Optional[str]]] = []
+        self._lock = threading.Lock()
+
+    def add(self, user_id: int, chat_id: int, raw_value: Optional[str]) -> None:
+        expires_at = _parse_ban_expiry(raw_value)
+        with self._lock:
+            self._bans[(user_id, chat_id)] = (expires_at, raw_value)
+            if expires_at is not None:
+                heapq.heappush(self._expiries, (expires_at, user_id, chat_id, raw_value))
+
+    def remove(self, user_id: int, chat_id: int) -> None:
+        with self._lock:
+            self._bans.pop((user_id, chat_id), None)
+
+    def is_banned(self, user_id: int, chat_id: int, now: float) -> bool:
+        entry = self._bans.get((user_id, chat_id))
+        if entry is None:
+            return False
+        expires_at = entry[0]
+        return expires_at is None or expires_at > now
+
+    def pop_expired(self, now: float) -> List[Tuple[int, int, Optional[str]]]:
+        """Drop bans that expired by ``now`` and return them as (user_id, chat_id, raw_value)."""
+        expired = []
+        with self._lock:
+            while self._expiries and self._expiries[0][0] <= now:
+                expires_at, user_id, chat_id, raw_value = heapq.heappop(self._expiries)
+                key = (user_id, chat_id)
+                if self._bans.get(key) != (expires_at, raw_value):
+                    continue
+                del self._bans[key]
+                expired.append((user_id, chat_id, raw_value))
+        return expired
+
+    def next_expiry(self) -> Optional[float]:
+        with self._lock:
+            return self._expiries[0][0] if self._expiries else None
+
+
+def _parse_ban_expiry(raw_value: Optional[str]) -> Optional[float]:
+    if not raw_value:
+        return None
+    try:
+        return datetime.fromisoformat(raw_value).replace(tzinfo=timezone.utc).timestamp()
+    except ValueError:
+        print(f"Unparsable ban expiry {raw_value!r}, treating as permanent")
+        return None
+
+
 class Database:
-    def __init__(self, connection) -> None:
+    def __init__(
+        self,
+        connection,
+        reader_factory: Optional[Callable[[], sqlite3.Connection]] = None,
+        read_pool_size: int = READ_POOL_SIZE,
+    ) -> None:
         self._connection = connection
         self._lock = threading.Lock()
+        # Without a reader factory (e.g. an in-memory database) reads share the writer connection
+        self._readers = _ReaderPool(reader_factory, read_pool_size) if reader_factory else None
+        self._writer = _BatchWriter(connection, self._lock)
+        self._settings_cache: LoadingCache[Optional[int], EffectiveSettings] = LoadingCache(
+            SETTINGS_CACHE_SIZE, self._resolve_settings
+        )
+        self._roster_cache: LoadingCache[int, ChatRoster] = LoadingCache(ROSTER_CACHE_SIZE, self._load_roster)
+        # Keyed by template scope: None for global-only (private chats) or a chat id
+        self._matcher_cache: LoadingCache[Optional[int], QuestionMatcher] = LoadingCache(
+            MATCHER_CACHE_SIZE, self._build_question_matcher
+        )
         self._ensure_tables()
+        self._global_revision = self._read_global_revision()
+        self._global_revision_checked = time.monotonic()
+        self._ban_index = _BanIndex()
+        self._load_bans()
+        self._closing = threading.Event()
+        self._ban_wakeup = threading.Event()
+        self._ban_sweeper = threading.Thread(target=self._sweep_bans, name="ban-sweeper", daemon=True)
+        self._ban_sweeper.start()
+
+    @contextmanager
+    def _read_connection(self) -> Iterator[sqlite3.Connection]:
+        if self._readers is None:
+            with _timed_lock(self._lock, "db.read"):
+                yield self._connection
+            return
+        with self._readers.connection() as connection:
+            yield connection
 
     def _fetchone(self, query: str, params=()) -> Optional[Sequence]:
         """Execute a query and return the first row (or None)."""
-        with self._lock:
-            return self._connection.execute(query, params).fetchone()
+        with self._read_connection() as connection:
+            return connection.execute(query, params).fetchone()
 
     def _fetchall(self, query: str, params=()) -> List[Sequence]:
         """Execute a query and return all rows."""
-        with self._lock:
-            return self._connection.execute(query, params).fetchall() or []
-
-    def _commit_query(self, query: str, params=()):
-        """Execute a query and commit."""
-        with self._lock:
-            self._connection.execute(query, params)
-            self._connection.commit()
+        with self._read_connection() as connection:
+            return connection.execute(query, params).fetchall() or []
+
+    def _commit_query(self, query: str, params=(), wait: bool = True) -> Future:
+        """Queue a mutation for the writer thread.
+
+        With ``wait`` the call blocks until the batch holding the statement is
+        committed, so a following read sees it. The returned future resolves to
+        the statement's rowcount.
+        """
+        future = self._writer.submit(query, params, urgent=wait)
+        if wait:
+            future.result()
+        return future
+
+    def _commit_many(self, query: str, rows: Sequence[Sequence], wait: bool = True) -> Future:
+        """Queue an executemany mutation for the writer thread."""
+        future = self._writer.submit(query, rows, many=True, urgent=wait)
+        if wait:
+            future.result()
+        return future
 
     @classmethod
-    def init(cls, database_path: str) -> "Database":
+    def init(cls, database_path: str, read_pool_size: int = READ_POOL_SIZE) -> "Database":
         connection = sqlite3.connect(database_path, check_same_thread=False)
         connection.execute("PRAGMA journal_mode=WAL")
-        return cls(connection)
+        if database_path in (":memory:", ""):
+            # Such a database is private to its connection; readers would each see an empty one
+            return cls(connection)
+
+        def open_reader() -> sqlite3.Connection:
+            reader = sqlite3.connect(database_path, check_same_thread=False)
+            reader.execute("PRAGMA query_only = ON")
+            return reader
+
+        return cls(connection, reader_factory=open_reader, read_pool_size=read_pool_size)
 
     def ensure_user(self, user_id: int, username: str, chat_id: int) -> None:
+        # Known users with an unchanged username need no write at all
+        roster = self._roster_cache.get(chat_id)
+        if user_id in roster.usernames and roster.usernames[user_id] == username:
+            return
+        # New users and renames are rare; wait so the handler can read the row right away
         self._commit_query(
             """
             INSERT INTO "user" (id, username, chat_id)
@@ -86,6 +461,7 @@ class Database:
             """,
             (user_id, username, chat_id),
         )
+        self._roster_cache.invalidate(chat_id)
 
     def get_user(self, user_id: int, chat_id: int) -> Optional[UserRecord]:
         row = self._fetchone(
@@ -126,6 +502,18 @@ class Database:
             "UPDATE user SET tag = ? WHERE id = ? AND chat_id = ?",
             (should_tag, user_id, chat_id),
         )
+        self._roster_cache.invalidate(chat_id)
+
+    def set_user_weight(self, user_id: int, chat_id: int, weight: float) -> None:
+        self._commit_query(
+            "UPDATE user SET weight = ? WHERE id = ? AND chat_id = ?",
+            (min(MAX_USER_WEIGHT, max(0.0, weight)), user_id, chat_id),
+        )
+        self._roster_cache.invalidate(chat_id)
+
+    def get_chat_roster(self, chat_id: int) -> ChatRoster:
+        """Return the cached roster of ``chat_id``, loading it on first use."""
+        return self._roster_cache.get(chat_id)
 
     def get_question_templates(self, chat_id: Optional[int] = None) -> List[QuestionTemplate]:
         if chat_id is None:
@@ -148,6 +536,15 @@ class Database:
             )
         return list(template_map.values())
 
+    def get_question_matcher(self, chat_id: Optional[int] = None) -> QuestionMatcher:
+        """Return the compiled matcher for the templates visible in ``chat_id``.
+
+        Uses the same scope rules as ``get_question_templates``; matchers are
+        rebuilt only after a template in that scope is saved or deleted.
+        """
+        self._check_global_revision()
+        return self._matcher_cache.get(chat_id)
+
     def get_question_triggers(self, chat_id: Optional[int] = None) -> List[str]:
         templates = self.get_question_templates(chat_id)
         return sorted({template.trigger_text for template in templates})
@@ -162,190 +559,72 @@ class Database:
             """,
             (template.chat_id, template.trigger_text, template.response_template),
         )
+        self._invalidate_question_matchers(template.chat_id)
 
     def delete_question_template(self, chat_id: int, trigger_text: str) -> bool:
-        self._commit_query(
+        future = self._commit_query(
             "DELETE FROM question_templates WHERE chat_id = ? AND trigger_text = ?",
             (chat_id, trigger_text),
         )
-        return self._connection.total_changes > 0
+        self._invalidate_question_matchers(chat_id)
+        return future.result() > 0
 
-    def get_insult_probability(self, chat_id: Optional[int] = None) -> float:
-        if chat_id is not None:
-            chat_value = self._get_chat_setting(chat_id, INSULT_PROBABILITY_KEY)
-            if chat_value is not None:
-                try:
-                    return float(chat_value)
-                except (TypeError, ValueError):
-                    pass
+    def get_effective_settings(self, chat_id: Optional[int] = None) -> EffectiveSettings:
+        """Return settings for ``chat_id`` with the global fallback applied.
 
-        row = self._fetchone(
-            """
-            SELECT value FROM bot_settings WHERE key = ?
-            """,
-            (INSULT_PROBABILITY_KEY,),
-        )
-        if not row:
-            return DEFAULT_INSULT_PROBABILITY
-        try:
-            return float(row[0])
-        except (TypeError, ValueError):
-            return DEFAULT_INSULT_PROBABILITY
+        Resolved objects are kept in a bounded LRU and dropped by the setters,
+        so repeated calls for the same chat do not touch SQLite.
+        """
+        self._check_global_revision()
+        return self._settings_cache.get(chat_id)
+
+    def get_insult_probability(self, chat_id: Optional[int] = None) -> float:
+        return self.get_effective_settings(chat_id).insult_probability
 
     def set_insult_probability(self, probability: float, chat_id: Optional[int] = None) -> None:
         if chat_id is not None:
             self._set_chat_setting(chat_id, INSULT_PROBABILITY_KEY, str(probability))
             return
-
-        self._commit_query(
-            """
-            INSERT INTO bot_settings (key, value)
-            VALUES (?, ?)
-            ON CONFLICT (key) DO UPDATE SET value = excluded.value
-            """,
-            (INSULT_PROBABILITY_KEY, str(probability)),
-        )
+        self._set_global_setting(INSULT_PROBABILITY_KEY, str(probability))
 
     def get_insult_boost_multiplier(self, chat_id: Optional[int] = None) -> float:
-        if chat_id is not None:
-            chat_value = self._get_chat_setting(chat_id, INSULT_BOOST_KEY)
-            if chat_value is not None:
-                try:
-                    return max(1.0, float(chat_value))
-                except (TypeError, ValueError):
-                    pass
-
-        row = self._fetchone(
-            "SELECT value FROM bot_settings WHERE key = ?",
-            (INSULT_BOOST_KEY,),
-        )
-        if not row:
-            return DEFAULT_INSULT_BOOST
-        try:
-            return max(1.0, float(row[0]))
-        except (TypeError, ValueError):
-            return DEFAULT_INSULT_BOOST
+        return self.get_effective_settings(chat_id).insult_boost_multiplier
 
     def set_insult_boost_multiplier(self, multiplier: float, chat_id: Optional[int] = None) -> None:
         multiplier = max(1.0, multiplier)
         if chat_id is not None:
             self._set_chat_setting(chat_id, INSULT_BOOST_KEY, str(multiplier))
             return
-
-        self._commit_query(
-            """
-            INSERT INTO bot_settings (key, value)
-            VALUES (?, ?)
-            ON CONFLICT (key) DO UPDATE SET value = excluded.value
-            """,
-            (INSULT_BOOST_KEY, str(multiplier)),
-        )
+        self._set_global_setting(INSULT_BOOST_KEY, str(multiplier))
 
     def get_insult_level(self, chat_id: Optional[int] = None) -> int:
-        if chat_id is not None:
-            chat_value = self._get_chat_setting(chat_id, INSULT_LEVEL_KEY)
-            if chat_value is not None:
-                try:
-                    return int(chat_value)
-                except ValueError:
-                    pass
-
-        row = self._fetchone(
-            """
-            SELECT value FROM bot_settings WHERE key = ?
-            """,
-            (INSULT_LEVEL_KEY,),
-        )
-        if not row:
-            return DEFAULT_INSULT_LEVEL
-        try:
-            return int(row[0])
-        except (TypeError, ValueError):
-            return DEFAULT_INSULT_LEVEL
+        return self.get_effective_settings(chat_id).insult_level
 
     def get_question_phrase_chance(self, chat_id: Optional[int] = None) -> float:
-        if chat_id is not None:
-            chat_value = self._get_chat_setting(chat_id, QUESTION_PHRASE_CHANCE_KEY)
-            if chat_value is not None:
-                try:
-                    return max(0.0, min(1.0, float(chat_value)))
-                except (TypeError, ValueError):
-                    pass
-
-        row = self._fetchone(
-            "SELECT value FROM bot_settings WHERE key = ?",
-            (QUESTION_PHRASE_CHANCE_KEY,),
-        )
-        if not row:
-            return DEFAULT_QUESTION_PHRASE_CHANCE
-        try:
-            return max(0.0, min(1.0, float(row[0])))
-        except (TypeError, ValueError):
-            return DEFAULT_QUESTION_PHRASE_CHANCE
+        return self.get_effective_settings(chat_id).question_phrase_chance
 
     def get_when_phrase_chance(self, chat_id: Optional[int] = None) -> float:
-        if chat_id is not None:
-            chat_value = self._get_chat_setting(chat_id, WHEN_PHRASE_CHANCE_KEY)
-            if chat_value is not None:
-                try:
-                    return max(0.0, min(1.0, float(chat_value)))
-                except (TypeError, ValueError):
-                    pass
-
-        row = self._fetchone(
-            "SELECT value FROM bot_settings WHERE key = ?",
-            (WHEN_PHRASE_CHANCE_KEY,),
-        )
-        if not row:
-            return DEFAULT_WHEN_PHRASE_CHANCE
-        try:
-            return max(0.0, min(1.0, float(row[0])))
-        except (TypeError, ValueError):
-            return DEFAULT_WHEN_PHRASE_CHANCE
+        return self.get_effective_settings(chat_id).when_phrase_chance
 
     def set_insult_level(self, level: int, chat_id: Optional[int] = None) -> None:
         if chat_id is not None:
             self._set_chat_setting(chat_id, INSULT_LEVEL_KEY, str(level))
             return
-
-        self._commit_query(
-            """
-            INSERT INTO bot_settings (key, value)
-            VALUES (?, ?)
-            ON CONFLICT (key) DO UPDATE SET value = excluded.value
-            """,
-            (INSULT_LEVEL_KEY, str(level)),
-        )
+        self._set_global_setting(INSULT_LEVEL_KEY, str(level))
 
     def set_question_phrase_chance(self, chance: float, chat_id: Optional[int] = None) -> None:
         chance = max(0.0, min(1.0, chance))
         if chat_id is not None:
             self._set_chat_setting(chat_id, QUESTION_PHRASE_CHANCE_KEY, str(chance))
             return
-
-        self._commit_query(
-            """
-            INSERT INTO bot_settings (key, value)
-            VALUES (?, ?)
-            ON CONFLICT (key) DO UPDATE SET value = excluded.value
-            """,
-            (QUESTION_PHRASE_CHANCE_KEY, str(chance)),
-        )
+        self._set_global_setting(QUESTION_PHRASE_CHANCE_KEY, str(chance))
 
     def set_when_phrase_chance(self, chance: float, chat_id: Optional[int] = None) -> None:
         chance = max(0.0, min(1.0, chance))
         if chat_id is not None:
             self._set_chat_setting(chat_id, WHEN_PHRASE_CHANCE_KEY, str(chance))
             return
-
-        self._commit_query(
-            """
-            INSERT INTO bot_settings (key, value)
-            VALUES (?, ?)
-            ON CONFLICT (key) DO UPDATE SET value = excluded.value
-            """,
-            (WHEN_PHRASE_CHANCE_KEY, str(chance)),
-        )
+        self._set_global_setting(WHEN_PHRASE_CHANCE_KEY, str(chance))
 
     def get_chat_insult_overrides(self, chat_id: int) -> Tuple[Optional[float], Optional[int], Optional[float]]:
         raw_probability = self._get_chat_setting(chat_id, INSULT_PROBABILITY_KEY)
@@ -444,27 +723,76 @@ class Database:
             """,
             (user_id, chat_id, value),
         )
+        self._ban_index.add(user_id, chat_id, value)
+        self._ban_wakeup.set()
 
     def remove_chat_ban(self, user_id: int, chat_id: int) -> None:
         self._commit_query(
             "DELETE FROM chat_bans WHERE user_id = ? AND chat_id = ?",
             (user_id, chat_id),
         )
+        self._ban_index.remove(user_id, chat_id)
 
     def is_chat_banned(self, user_id: int, chat_id: int) -> bool:
+        return self._ban_index.is_banned(user_id, chat_id, time.time())
+
+    def get_image_description(self, key: str, max_age: float = IMAGE_DESCRIPTION_TTL) -> Optional[Tuple[str, float]]:
+        """Return (description, created_at unix time) if stored within ``max_age`` seconds."""
         row = self._fetchone(
-            "SELECT banned_until FROM chat_bans WHERE user_id = ? AND chat_id = ?",
-            (user_id, chat_id),
+            "SELECT description, created_at FROM image_descriptions WHERE key = ? AND created_at >= ?",
+            (key, time.time() - max_age),
+        )
+        return (row[0], row[1]) if row else None
+
+    def save_image_description(self, key: str, description: str) -> None:
+        # Nothing reads it back right away, so it rides the next write batch
+        self._commit_query(
+            """
+            INSERT INTO image_descriptions (key, description, created_at)
+            VALUES (?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET
+                description = excluded.description,
+                created_at = excluded.created_at
+            """,
+            (key, description, time.time()),
+            wait=False,
+        )
+
+    def load_chat_history(self, chat_id: int) -> List[Tuple[int, str, str, Optional[str]]]:
+        """Return the chat's stored history as (seq, name, content, reply_to), oldest first."""
+        return [
+            tuple(row)
+            for row in self._fetchall(
+                "SELECT seq, name, content, reply_to FROM chat_history WHERE chat_id = ? ORDER BY seq",
+                (chat_id,),
+            )
+        ]
+
+    def append_chat_history(
+        self, chat_id: int, seq: int, slots: int, name: str, content: str, reply_to: Optional[str]
+    ) -> None:
+        """Write entry ``seq`` into ring slot ``seq % slots``, replacing the oldest entry."""
+        self._commit_query(
+            """
+            INSERT INTO chat_history (chat_id, slot, seq, name, content, reply_to)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (chat_id, slot) DO UPDATE SET
+                seq = excluded.seq,
+                name = excluded.name,
+                content = excluded.content,
+                reply_to = excluded.reply_to
+            """,
+            (chat_id, seq % slots, seq, name, content, reply_to),
+            wait=False,
+        )
+
+    def update_chat_history_content(self, chat_id: int, seq: int, slots: int, content: str) -> None:
+        # A no-op when the slot has been reused by a newer entry meanwhile
+        self._commit_query(
+            "UPDATE chat_history SET content = ? WHERE chat_id = ? AND slot = ? AND seq = ?",
+            (content, chat_id, seq % slots, seq),
+            wait=False,
         )
-        if not row:
-            return False
-        banned_until_str = row[0]
-        if banned_until_str:
-            banned_until = datetime.fromisoformat(banned_until_str).replace(tzinfo=timezone.utc)
-            if banned_until <= datetime.now(timezone.utc):
-                self.remove_chat_ban(user_id, chat_id)
-                return False
-        return True
 
     def get_chat_users(self, chat_id: int) -> List[UserRecord]:
         rows = self._fetchall(
@@ -474,6 +802,12 @@ class Database:
         return [self._map_user(row) for row in rows if row]
 
     def close(self) -> None:
+        self._closing.set()
+        self._ban_wakeup.set()
+        self._ban_sweeper.join()
+        self._writer.close()
+        if self._readers is not None:
+            self._readers.close()
         self._connection.close()
 
     @staticmethod
@@ -546,6 +880,50 @@ class Database:
             """
         )
 
+    def _ensure_global_revision_table(self) -> None:
+        # Single row bumped on every global settings/template change
+        self._commit_query(
+            """
+            CREATE TABLE IF NOT EXISTS global_revision (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                revision INTEGER NOT NULL
+            )
+            """
+        )
+        self._commit_query("INSERT OR IGNORE INTO global_revision (id, revision) VALUES (0, 0)")
+
+    def _ensure_image_descriptions_table(self) -> None:
+        self._commit_query(
+            """
+            CREATE TABLE IF NOT EXISTS image_descriptions (
+                key TEXT PRIMARY KEY,
+                description TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        # Expired rows are never read again; drop them once per start
+        self._commit_query(
+            "DELETE FROM image_descriptions WHERE created_at < ?",
+            (time.time() - IMAGE_DESCRIPTION_TTL,),
+        )
+
+    def _ensure_chat_history_table(self) -> None:
+        # Ring buffer: a chat never has more rows than history slots
+        self._commit_query(
+            """
+            CREATE TABLE IF NOT EXISTS chat_history (
+                chat_id INTEGER NOT NULL,
+                slot INTEGER NOT NULL,
+                seq INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                content TEXT NOT NULL,
+                reply_to TEXT,
+                PRIMARY KEY (chat_id, slot)
+            )
+            """
+        )
+
     def _ensure_tables(self) -> None:
         self._ensure_user_table()
         self._ensure_question_templates_table()
@@ -553,6 +931,9 @@ class Database:
         self._ensure_chat_settings_table()
         self._ensure_chat_admins_table()
         self._ensure_chat_bans_table()
+        self._ensure_global_revision_table()
+        self._ensure_image_descriptions_table()
+        self._ensure_chat_history_table()
         self._ensure_default_question_templates()
 
     def _ensure_user_table(self) -> None:
@@ -564,10 +945,15 @@ class Database:
                 chat_id  INTEGER,
                 tag      INTEGER DEFAULT 1,
                 is_admin INTEGER DEFAULT 0,
+                weight   REAL DEFAULT 1,
                 PRIMARY KEY (id, chat_id)
             )
             """
         )
+        columns = {row[1] for row in self._fetchall('PRAGMA table_info("user")')}
+        if "weight" not in columns:
+            self._commit_query('ALTER TABLE "user" ADD COLUMN weight REAL DEFAULT 1')
+        self._commit_query('CREATE INDEX IF NOT EXISTS user_chat_id ON "user" (chat_id)')
 
     def _ensure_default_question_templates(self) -> None:
         existing = {row[0] for row in self._fetchall(
@@ -581,15 +967,36 @@ class Database:
         ]
         if not templates_to_insert:
             return
-        with self._lock:
-            self._connection.executemany(
-                """
-                INSERT INTO question_templates (chat_id, trigger_text, response_template)
-                VALUES (?, ?, ?)
-                """,
-                templates_to_insert,
-            )
-            self._connection.commit()
+        self._commit_many(
+            """
+            INSERT INTO question_templates (chat_id, trigger_text, response_template)
+            VALUES (?, ?, ?)
+            """,
+            templates_to_insert,
+        )
+
+    def _load_bans(self) -> None:
+        rows = self._fetchall("SELECT user_id, chat_id, banned_until FROM chat_bans")
+        for user_id, chat_id, banned_until in rows:
+            self._ban_index.add(user_id, chat_id, banned_until)
+
+    def _sweep_bans(self) -> None:
+        """Delete expired bans from SQLite, sleeping until the next expiry."""
+        while not self._closing.is_set():
+            now = time.time()
+            for user_id, chat_id, raw_value in self._ban_index.pop_expired(now):
+                # Match on the stored value so a fresh re-ban is left alone
+                self._commit_query(
+                    "DELETE FROM chat_bans WHERE user_id = ? AND chat_id = ? AND banned_until = ?",
+                    (user_id, chat_id, raw_value),
+                    wait=False,
+                )
+            next_expiry = self._ban_index.next_expiry()
+            timeout = BAN_SWEEP_INTERVAL
+            if next_expiry is not None:
+                timeout = min(timeout, max(0.0, next_expiry - time.time()))
+            self._ban_wakeup.wait(timeout)
+            self._ban_wakeup.clear()
 
     def _get_chat_setting(self, chat_id: int, key: str) -> Optional[str]:
         row = self._fetchone(
@@ -607,3 +1014,87 @@ class Database:
             """,
             (chat_id, key, value),
         )
+        self._invalidate_settings(chat_id)
+
+    def _set_global_setting(self, key: str, value: str) -> None:
+        self._commit_query(
+            """
+            INSERT INTO bot_settings (key, value)
+            VALUES (?, ?)
+            ON CONFLICT (key) DO UPDATE SET value = excluded.value
+            """,
+            (key, value),
+        )
+        # Every chat without its own override inherits the global value
+        self._bump_global_revision()
+        self._invalidate_settings()
+
+    def _load_roster(self, chat_id: int) -> ChatRoster:
+        rows = self._fetchall(
+            "SELECT id, username, chat_id, tag, is_admin, weight FROM user WHERE chat_id = ?",
+            (chat_id,),
+        )
+        return ChatRoster(rows)
+
+    def _build_question_matcher(self, scope: Optional[int]) -> QuestionMatcher:
+        return QuestionMatcher(self.get_question_templates(scope))
+
+    def _invalidate_question_matchers(self, chat_id: int) -> None:
+        # Global templates are part of every scope
+        if chat_id == GLOBAL_CHAT_ID:
+            self._bump_global_revision()
+            self._matcher_cache.clear()
+        else:
+            self._matcher_cache.invalidate(chat_id)
+
+    def _read_global_revision(self) -> int:
+        row = self._fetchone("SELECT revision FROM global_revision WHERE id = 0")
+        return row[0] if row else 0
+
+    def _bump_global_revision(self) -> None:
+        """Tell other processes sharing the file that global state changed."""
+        self._commit_query("UPDATE global_revision SET revision = revision + 1 WHERE id = 0")
+        # Read before the caller clears its caches: later foreign bumps still show up as a change
+        self._global_revision = self._read_global_revision()
+
+    def _check_global_revision(self) -> None:
+        """Drop global-dependent caches if another process changed global state."""
+        now = time.monotonic()
+        if now - self._global_revision_checked < GLOBAL_REVISION_CHECK_INTERVAL:
+            return
+        self._global_revision_checked = now
+        revision = self._read_global_revision()
+        if revision != self._global_revision:
+            self._global_revision = revision
+            self._settings_cache.clear()
+            self._matcher_cache.clear()
+
+    def _invalidate_settings(self, chat_id: Optional[int] = None) -> None:
+        """Drop the cached settings of ``chat_id``, or of every chat when omitted."""
+        if chat_id is None:
+            self._settings_cache.clear()
+        else:
+            self._settings_cache.invalidate(chat_id)
+
+    def _resolve_settings(self, chat_id: Optional[int]) -> EffectiveSettings:
+        global_values = dict(self._fetchall("SELECT key, value FROM bot_settings"))
+        chat_values = {}
+        if chat_id is not None:
+            chat_values = dict(self._fetchall(
+                "SELECT key, value FROM chat_settings WHERE chat_id = ?",
+                (chat_id,),
+            ))
+
+        resolved = {}
+        for key, (field_name, parse, default) in _SETTING_SPECS.items():
+            resolved[field_name] = default
+            # An unparsable chat override falls back to the global value
+            for raw_value in (chat_values.get(key), global_values.get(key)):
+                if raw_value is None:
+                    continue
+                try:
+                    resolved[field_name] = parse(raw_value)
+                    break
+                except (TypeError, ValueError):
+                    continue
+        return EffectiveSettings(**resolved)
@@ -0,0 +1,75 @@
+import time
+
+from typing import Callable, Optional, Tuple
+
+from app.cache import LRUCache
+from app.db import IMAGE_DESCRIPTION_TTL, Database
+from app.media import MediaHandle
+from app.metrics import metrics
+
+DESCRIPTION_CACHE_SIZE = 10_000
+
+
+class DescriptionCache:
+    """Image descriptions by content key: an in-memory LRU over a SQLite table.
+
+    Keys are ``tg:<file_unique_id>`` (same file, e.g. a forward) or
+    ``sha256:<digest>`` (same bytes uploaded again). Entries expire after
+    ``ttl`` seconds in both layers. Lookups count into ``image_cache.*``.
+    """
+
+    def __init__(self, db: Database, maxsize: int = DESCRIPTION_CACHE_SIZE, ttl: float = IMAGE_DESCRIPTION_TTL) -> None:
+        self._db = db
+        self._ttl = ttl
+        self._entries: LRUCache[str, Tuple[str, float]] = LRUCache(maxsize)
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            description, expires_at = entry
+            if expires_at > time.monotonic():
+                metrics.inc("image_cache.memory_hits")
+                return description
+            self._entries.pop(key)
+        row = self._db.get_image_description(key, self._ttl)
+        if row is None:
+            metrics.inc("image_cache.misses")
+            return None
+        metrics.inc("image_cache.db_hits")
+        description, created_at = row
+        # Keep it in memory only as long as the stored row stays valid
+        remaining = created_at + self._ttl - time.time()
+        self._entries.put(key, (description, time.monotonic() + remaining))
+        return description
+
+    def put(self, key: str, description: str) -> None:
+        self._entries.put(key, (description, time.monotonic() + self._ttl))
+        self._db.save_image_description(key, description)
+
+
+def describe_photo(
+    media: MediaHandle,
+    cache: DescriptionCache,
+    describe: Callable[[str], Optional[str]],
+) -> Optional[str]:
+    """Describe a photo, calling ``describe(data_url)`` only for unseen images.
+
+    The file_unique_id is checked before downloading anything; the content
+    hash is checked after the download, before the vision call.
+    """
+    unique_key = f"tg:{media.file_unique_id}"
+    description = cache.get(unique_key)
+    if description is not None:
+        return description
+    image_url = media.data_url()
+    if not image_url:
+        return None
+    content_key = f"sha256:{media.content_hash}"
+    description = cache.get(content_key)
+    if description is None:
+        description = describe(image_url)
+        if description is None:
+            return None
+        cache.put(content_key, description)
+    cache.put(unique_key, description)
+    return description
@@ -0,0 +1,59 @@
+import threading
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Hashable, Tuple
+
+from app.metrics import metrics
+
+HANDLER_WORKERS = 8
+# Tasks one key may run back to back before its lane yields the worker to other keys
+DISPATCH_BATCH = 8
+
+
+class KeyedDispatcher:
+    """Runs tasks in parallel across keys and strictly in order within a key.
+
+    Each key with pending work owns one lane: a deque drained by a single pool
+    task at a time, so two tasks of the same key never overlap. A busy lane
+    re-queues itself after ``DISPATCH_BATCH`` tasks, letting other keys in.
+    """
+
+    def __init__(self, workers: int = HANDLER_WORKERS, name: str = "dispatch") -> None:
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix=name)
+        self._lanes: Dict[Hashable, Deque[Tuple[Callable[..., Any], Tuple[Any, ...]]]] = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        """Tasks queued across all keys and not started yet."""
+        return self._pending
+
+    def submit(self, key: Hashable, func: Callable[..., Any], *args: Any) -> None:
+        with self._lock:
+            self._pending += 1
+            metrics.set("dispatch.pending", self._pending)
+            lane = self._lanes.get(key)
+            if lane is not None:
+                lane.append((func, args))
+                return
+            self._lanes[key] = deque([(func, args)])
+            metrics.set("dispatch.active_keys", len(self._lanes))
+        self._executor.submit(self._drain, key)
+
+    def _drain(self, key: Hashable) -> None:
+        for _ in range(DISPATCH_BATCH):
+            with self._lock:
+                lane = self._lanes[key]
+                if not lane:
+                    del self._lanes[key]
+                    metrics.set("dispatch.active_keys", len(self._lanes))
+                    return
+                func, args = lane.popleft()
+                self._pending -= 1
+            try:
+                func(*args)
+            except Exception as exc:
+                print(f"Handler {getattr(func, '__name__', func)} failed for {key}: {exc}")
+        self._executor.submit(self._drain, key)
@@ -0,0 +1,219 @@
+import sys
+import threading
+
+from collections import OrderedDict, deque
+from concurrent.futures import Future, wait
+from typing import TYPE_CHECKING, Deque, List, Optional
+
+from app.metrics import metrics
+
+if TYPE_CHECKING:
+    from app.db import Database
+
+BOT_NAME = "Быдлик"
+HISTORY_LIMIT = 20
+# Chats kept in memory; the least recently active ones are dropped first
+HISTORY_MAX_CHATS = 20_000
+# Rough cap on the memory held by history text across all chats
+HISTORY_MAX_BYTES = 64 * 1024 * 1024
+# Slots object plus deque cell, on top of the strings themselves
+_ENTRY_OVERHEAD = 120
+
+
+class HistoryEntry:
+    """One line of a chat's in-memory history.
+
+    ``reply_to`` is the replied-to message formatted like "[БОТ]: текст" or
+    "имя: текст". ``content`` of a photo starts as a placeholder; ``pending``
+    is the background description that replaces it when done. The prompt line
+    is formatted on first use and cached until the content changes.
+    """
+
+    __slots__ = ("name", "_content", "reply_to", "pending", "_line", "size", "seq")
+
+    def __init__(
+        self,
+        name: str,
+        content: str,
+        reply_to: Optional[str] = None,
+        pending: Optional["Future[Optional[str]]"] = None,
+    ) -> None:
+        # The same few names repeat across thousands of entries
+        self.name = sys.intern(name)
+        self._content = content
+        self.reply_to = reply_to
+        self.pending = pending
+        self._line: Optional[str] = None
+        # Approximate bytes held as counted by the store; only the store changes it
+        self.size = self.measure()
+        # Position in the chat's history, assigned by the store
+        self.seq = -1
+
+    def measure(self) -> int:
+        """Approximate bytes the entry holds right now."""
+        reply_size = sys.getsizeof(self.reply_to) if self.reply_to else 0
+        return _ENTRY_OVERHEAD + sys.getsizeof(self._content) + reply_size
+
+    @property
+    def content(self) -> str:
+        return self._content
+
+    @content.setter
+    def content(self, value: str) -> None:
+        self._content = value
+        self._line = None
+
+    @property
+    def line(self) -> str:
+        """The entry as it appears in the insult prompt."""
+        line = self._line
+        if line is None:
+            if self.name == BOT_NAME:
+                line = f"[БОТ]: {self._content}"
+            else:
+                line = f"{self.name}: {self._content}"
+            if self.reply_to:
+                line = f"{line} [в ответ на: \"{self.reply_to}\"]"
+            self._line = line
+        return line
+
+    def wait(self, timeout: float) -> None:
+        """Give a pending description up to ``timeout`` seconds to land."""
+        if self.pending is not None and not self.pending.done():
+            wait([self.pending], timeout)
+
+
+class _ChatHistory:
+    __slots__ = ("entries", "size", "next_seq")
+
+    def __init__(self, limit: int) -> None:
+        self.entries: Deque[HistoryEntry] = deque(maxlen=limit)
+        self.size = 0
+        self.next_seq = 0
+
+
+class HistoryStore:
+    """Last ``limit`` entries per chat, bounded in chats and in memory.
+
+    Chats are kept in LRU order of activity; when there are more than
+    ``max_chats`` or the estimated size exceeds ``max_bytes``, the idlest
+    chats are dropped whole.
+
+    With ``db`` the history also lives in its ``chat_history`` ring buffer
+    (``limit`` rows per chat): appends are queued to the batch writer, and a
+    chat that is not in memory is read back on first touch, so neither
+    startup nor eviction loses it.
+    """
+
+    def __init__(
+        self,
+        db: Optional["Database"] = None,
+        limit: int = HISTORY_LIMIT,
+        max_chats: int = HISTORY_MAX_CHATS,
+        max_bytes: int = HISTORY_MAX_BYTES,
+    ) -> None:
+        self._db = db
+        self._limit = limit
+        self._max_chats = max(1, max_chats)
+        self._max_bytes = max_bytes
+        self._chats: "OrderedDict[int, _ChatHistory]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def append(self, chat_id: int, entry: HistoryEntry) -> None:
+        loaded = None
+        while True:
+            # Lookup, append, accounting and eviction in one hold, so the chat
+            # cannot be evicted while the entry is being counted into it
+            with self._lock:
+                chat = self._chat_locked(chat_id, loaded)
+                if chat is not None:
+                    if len(chat.entries) == chat.entries.maxlen:
+                        dropped = chat.entries[0].size
+                        chat.size -= dropped
+                        self._size -= dropped
+                    entry.seq = chat.next_seq
+                    chat.next_seq += 1
+                    chat.entries.append(entry)
+                    chat.size += entry.size
+                    self._size += entry.size
+                    self._evict()
+                    break
+            loaded = self._load(chat_id)
+        if self._db is not None:
+            self._db.append_chat_history(
+                chat_id, entry.seq, self._limit, entry.name, entry.content, entry.reply_to
+            )
+
+    def update(self, chat_id: int, entry: HistoryEntry) -> None:
+        """Account for and store an appended entry's changed content (a late photo description)."""
+        with self._lock:
+            chat = self._chats.get(chat_id)
+            # Entries already dropped or in an evicted chat are no longer counted
+            if chat is not None and any(current is entry for current in chat.entries):
+                delta = entry.measure() - entry.size
+                entry.size += delta
+                chat.size += delta
+                self._size += delta
+                self._evict()
+        if self._db is not None and entry.seq >= 0:
+            self._db.update_chat_history_content(chat_id, entry.seq, self._limit, entry.content)
+
+    def entries(self, chat_id: int) -> List[HistoryEntry]:
+        """Snapshot of a chat's entries, oldest first."""
+        loaded = None
+        while True:
+            with self._lock:
+                chat = self._chat_locked(chat_id, loaded)
+                if chat is not None:
+                    self._evict()
+                    return list(chat.entries)
+            loaded = self._load(chat_id)
+
+    def __len__(self) -> int:
+        return len(self._chats)
+
+    def _chat_locked(self, chat_id: int, loaded: Optional[_ChatHistory]) -> Optional[_ChatHistory]:
+        """The chat marked most recent, installing ``loaded`` if it is missing.
+
+        Called under the lock. Returns None when the chat has to be read from
+        the database first; that read happens outside the lock so one chat's
+        load does not stall the others.
+        """
+        chat = self._chats.get(chat_id)
+        if chat is not None:
+            self._chats.move_to_end(chat_id)
+            return chat
+        if loaded is None:
+            if self._db is not None:
+                return None
+            loaded = _ChatHistory(self._limit)
+        self._chats[chat_id] = loaded
+        self._size += loaded.size
+        return loaded
+
+    def _load(self, chat_id: int) -> _ChatHistory:
+        chat = _ChatHistory(self._limit)
+        if self._db is None:
+            return chat
+        rows = self._db.load_chat_history(chat_id)
+        for seq, name, content, reply_to in rows:
+            entry = HistoryEntry(name, content, reply_to)
+            entry.seq = seq
+            chat.entries.append(entry)
+            chat.size += entry.size
+            chat.next_seq = seq + 1
+        if rows:
+            metrics.inc("history.loaded_chats")
+        return chat
+
+    def _evict(self) -> None:
+        # Never drops the chat that was just touched (the last one)
+        while len(self._chats) > 1 and (
+            len(self._chats) > self._max_chats or self._size > self._max_bytes
+        ):
+            _, chat = self._chats.popitem(last=False)
+            self._size -= chat.size
+            metrics.inc("history.evicted_chats")
+        metrics.set("history.chats", len(self._chats))
+        metrics.set("history.bytes", self._size)
@@ -1,9 +1,47 @@
+import asyncio
 import json
-from dataclasses import dataclass
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
 from datetime import date, datetime, timezone, timedelta
-from typing import List, Optional
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
 from urllib import request
-from openai import OpenAI
+
+import httpx
+
+from openai import AsyncOpenAI
+
+from app.breaker import BREAKER_COOLDOWN, BREAKER_FAILURE_THRESHOLD, CircuitBreaker
+from app.media import ImageBudget
+from app.metrics import metrics
+
+# Calls running at once / waiting for a worker before new ones are rejected
+LLM_MAX_CONCURRENCY = 4
+LLM_MAX_PENDING = 16
+# Hedging: wait this long for a provider before racing the next one, until enough samples exist
+HEDGE_DEFAULT_DELAY = 5.0
+HEDGE_PERCENTILE = 0.9
+HEDGE_MIN_SAMPLES = 10
+# Recent successful completion times kept per provider
+LATENCY_SAMPLES = 50
+# Weight of the newest call in a provider's moving averages of latency and success
+ROUTING_SMOOTHING = 0.2
+# Share of insults sent to a random other provider first, to keep its statistics fresh
+ROUTING_EXPLORATION = 0.05
+# A provider that always fails still gets a finite expected time
+_MIN_SUCCESS_RATE = 0.05
+# Seconds a failed attempt costs on top of its own time (the reply is delayed by the failover);
+# per provider it is its read timeout
+ROUTING_FAILURE_PENALTY = 30.0
+# Streamed insults stop after this many sentences or characters; 0 = no limit
+REPLY_MAX_SENTENCES = 3
+REPLY_MAX_CHARS = 600
+# A sentence only counts as finished once something follows its punctuation
+_SENTENCE_END = re.compile(r"[.!?…]+(?=\s)")
 
 
 BLOCKED_RESPONSE_PATTERNS = [
@@ -86,13 +124,138 @@ class LLMClient:
     api_key: str
     model: str
     supports_images: bool
-    client: OpenAI
+    client: AsyncOpenAI
+    breaker: CircuitBreaker
+    image_budget: ImageBudget = ImageBudget()
+    latencies: Deque[float] = field(default_factory=lambda: deque(maxlen=LATENCY_SAMPLES))
+    # Moving averages for routing: time per attempt (failed ones too) and share of successes
+    ewma_latency: Optional[float] = None
+    success_rate: float = 1.0
+    failure_penalty: float = ROUTING_FAILURE_PENALTY
+
+    def observe(self, success: bool, elapsed: float) -> None:
+        self.success_rate += ROUTING_SMOOTHING * ((1.0 if success else 0.0) - self.success_rate)
+        if self.ewma_latency is None:
+            self.ewma_latency = elapsed
+        else:
+            self.ewma_latency += ROUTING_SMOOTHING * (elapsed - self.ewma_latency)
+        if success:
+            self.latencies.append(elapsed)
+
+    def observe_cancelled(self, elapsed: float) -> None:
+        """An abandoned attempt (lost hedge, reply timeout) took at least ``elapsed``."""
+        # Only a lower bound: it can raise the estimate but says nothing about success
+        if self.ewma_latency is None:
+            self.ewma_latency = elapsed
+        elif elapsed > self.ewma_latency:
+            self.ewma_latency += ROUTING_SMOOTHING * (elapsed - self.ewma_latency)
+
+    def expected_time(self) -> float:
+        """Expected seconds until a usable answer; 0 for a provider not tried yet, so it gets tried.
+
+        Failures are charged ``failure_penalty`` each, so a provider that fails
+        fast ranks below a slow one that answers.
+        """
+        if self.ewma_latency is None:
+            return 0.0
+        success_rate = max(self.success_rate, _MIN_SUCCESS_RATE)
+        return self.ewma_latency / success_rate + (1.0 - success_rate) * self.failure_penalty
+
+    def hedge_threshold(self, default: float) -> float:
+        """The p90 of recent completion times, or ``default`` until there are enough."""
+        if len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return default
+        ordered = sorted(self.latencies)
+        return ordered[int(HEDGE_PERCENTILE * (len(ordered) - 1))]
 
     def is_blocked_response(self, content: Optional[str]) -> bool:
         if not content:
             return True
-        content_lower = content.lower()
-        return any(pattern.lower() in content_lower for pattern in BLOCKED_RESPONSE_PATTERNS)
+        return _has_blocked_pattern(content)
+
+
+def _has_blocked_pattern(content: str) -> bool:
+    content_lower = content.lower()
+    return any(pattern.lower() in content_lower for pattern in BLOCKED_RESPONSE_PATTERNS)
+
+
+def _reply_cutoff(text: str, max_sentences: int, max_chars: int) -> Optional[int]:
+    """Where a streamed reply should end, or None while it is within the limits."""
+    if max_sentences:
+        for count, match in enumerate(_SENTENCE_END.finditer(text), start=1):
+            if count >= max_sentences:
+                return match.end()
+    if max_chars and len(text) >= max_chars:
+        # Do not end in the middle of a word
+        space = text.rfind(" ", 0, max_chars)
+        return space if space > 0 else max_chars
+    return None
+
+class LLMExecutor:
+    """Bounded runner for LLM coroutines on a private event loop thread.
+
+    Every provider call shares one asyncio loop, so a waiting request costs a
+    coroutine instead of a thread. At most ``max_workers`` calls run at once and
+    ``max_pending`` more may wait. When both are taken, ``submit`` does not queue
+    the call and returns a future already resolved to None, which callers treat
+    like a failed call. The loop thread starts on first use.
+    """
+
+    def __init__(self, max_workers: int = LLM_MAX_CONCURRENCY, max_pending: int = LLM_MAX_PENDING) -> None:
+        self._max_workers = max(1, max_workers)
+        self._capacity = self._max_workers + max(0, max_pending)
+        self._depth = 0
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @property
+    def depth(self) -> int:
+        """Calls currently running or waiting."""
+        return self._depth
+
+    def submit(self, func: Callable[..., Awaitable[Optional[str]]], *args, **kwargs) -> "Future[Optional[str]]":
+        with self._lock:
+            if self._depth >= self._capacity:
+                metrics.inc("llm.rejected")
+                rejected: Future = Future()
+                rejected.set_result(None)
+                return rejected
+            self._depth += 1
+            metrics.set("llm.queue_depth", self._depth)
+            loop = self._ensure_loop()
+        metrics.inc("llm.submitted")
+        future = asyncio.run_coroutine_threadsafe(self._run(func, args, kwargs), loop)
+        future.add_done_callback(self._release)
+        return future
+
+    async def _run(self, func: Callable[..., Awaitable[Optional[str]]], args: tuple, kwargs: dict) -> Optional[str]:
+        async with self._semaphore:
+            return await func(*args, **kwargs)
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None:
+            loop = asyncio.new_event_loop()
+            self._semaphore = asyncio.Semaphore(self._max_workers)
+            threading.Thread(target=loop.run_forever, name="llm-loop", daemon=True).start()
+            self._loop = loop
+        return self._loop
+
+    def _release(self, _future: Future) -> None:
+        with self._lock:
+            self._depth -= 1
+            metrics.set("llm.queue_depth", self._depth)
+
+
+def result_or_none(future: "Future[Optional[str]]", timeout: float) -> Optional[str]:
+    """Wait for an LLM future; on timeout or error cancel it and return None."""
+    try:
+        return future.result(timeout=timeout)
+    except Exception as exc:
+        future.cancel()
+        print(f"  LLM call abandoned: {exc!r}")
+        return None
+
 
 class LLM:
     def __init__(
@@ -102,41 +265,108 @@ class LLM:
         tokens_api_key: str = "",
         tokens_username: str = "",
         tokens_password: str = "",
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        max_pending: int = LLM_MAX_PENDING,
+        breaker_failures: int = BREAKER_FAILURE_THRESHOLD,
+        breaker_cooldown: float = BREAKER_COOLDOWN,
+        hedging: bool = False,
+        hedge_delay: float = HEDGE_DEFAULT_DELAY,
+        exploration: float = ROUTING_EXPLORATION,
+        streaming: bool = True,
+        max_reply_sentences: int = REPLY_MAX_SENTENCES,
+        max_reply_chars: int = REPLY_MAX_CHARS,
     ) -> None:
-        self._clients: List[LLMClient] = []
-        for config in llm_configs:
-            self._clients.append(LLMClient(
-                base_url=config.base_url,
-                api_key=config.api_key,
-                model=config.model,
-                supports_images=config.supports_images,
-                client=OpenAI(base_url=config.base_url, api_key=config.api_key),
-            ))
+        self._executor = LLMExecutor(max_concurrency, max_pending)
+        self._streaming = streaming
+        self._max_reply_sentences = max_reply_sentences
+        self._max_reply_chars = max_reply_chars
+        self._exploration = exploration
+        self._hedging = hedging
+        self._hedge_delay = hedge_delay
+        self._breaker_failures = breaker_failures
+        self._breaker_cooldown = breaker_cooldown
+        self._clients: List[LLMClient] = [
+            self._build_client(config, f"API #{i+1}", config.supports_images)
+            for i, config in enumerate(llm_configs)
+        ]
 
         # Dedicated image client for describe_image (fast model)
         self._image_client: Optional[LLMClient] = None
         if image_config:
-            self._image_client = LLMClient(
-                base_url=image_config.base_url,
-                api_key=image_config.api_key,
-                model=image_config.model,
-                supports_images=True,
-                client=OpenAI(base_url=image_config.base_url, api_key=image_config.api_key),
-            )
+            self._image_client = self._build_client(image_config, "image API", True)
+        self.image_budget = self._combined_image_budget()
 
         self._base_url = llm_configs[0].base_url if llm_configs else ""
         self._tokens_api_key = tokens_api_key
         self._tokens_username = tokens_username
         self._tokens_password = tokens_password
 
-    def generate_insult(
+    def _build_client(self, config, name: str, supports_images: bool) -> LLMClient:
+        # Our own timeouts and retries replace the library's (minutes, with retries)
+        timeout = httpx.Timeout(config.read_timeout, connect=config.connect_timeout)
+        return LLMClient(
+            base_url=config.base_url,
+            api_key=config.api_key,
+            model=config.model,
+            supports_images=supports_images,
+            client=AsyncOpenAI(
+                base_url=config.base_url,
+                api_key=config.api_key,
+                timeout=timeout,
+                max_retries=config.max_retries,
+            ),
+            breaker=CircuitBreaker(name, self._breaker_failures, self._breaker_cooldown),
+            image_budget=ImageBudget(config.image_max_side, config.image_max_bytes),
+            failure_penalty=config.read_timeout,
+        )
+
+    def _combined_image_budget(self) -> ImageBudget:
+        """One budget every image-capable provider is happy with.
+
+        A photo is downloaded and encoded once per message and shared by the
+        description and the insult calls, so it must reach the largest pixel
+        budget and stay under the smallest byte cap.
+        """
+        budgets = [c.image_budget for c in self._clients if c.supports_images]
+        if self._image_client:
+            budgets.append(self._image_client.image_budget)
+        if not budgets:
+            return ImageBudget()
+        sides = [budget.max_side for budget in budgets]
+        byte_caps = [budget.max_bytes for budget in budgets if budget.max_bytes]
+        return ImageBudget(
+            max_side=0 if 0 in sides else max(sides),
+            max_bytes=min(byte_caps) if byte_caps else 0,
+        )
+
+    @property
+    def accepts_images(self) -> bool:
+        """Whether any insult provider can take the photo itself."""
+        return any(llm_client.supports_images for llm_client in self._clients)
+
+    def generate_insult(self, *args, **kwargs) -> Optional[str]:
+        """Blocking form of ``agenerate_insult``; never call it from the LLM loop."""
+        return self.submit_insult(*args, **kwargs).result()
+
+    def describe_image(self, *args, **kwargs) -> Optional[str]:
+        """Blocking form of ``adescribe_image``; never call it from the LLM loop."""
+        return self.submit_describe_image(*args, **kwargs).result()
+
+    def submit_insult(self, *args, **kwargs) -> "Future[Optional[str]]":
+        """Queue ``agenerate_insult`` on the bounded executor."""
+        return self._executor.submit(self.agenerate_insult, *args, **kwargs)
+
+    def submit_describe_image(self, *args, **kwargs) -> "Future[Optional[str]]":
+        """Queue ``adescribe_image`` on the bounded executor."""
+        return self._executor.submit(self.adescribe_image, *args, **kwargs)
+
+    async def agenerate_insult(
         self,
         user_name: str,
         user_message: str,
         insult_level: int,
         history: List[str],
-        image_base64: Optional[str] = None,
-        image_mime: str = "image/jpeg",
+        image_url: Optional[str] = None,
     ) -> Optional[str]:
         prompt_template = self._get_prompt_template(insult_level)
         if not prompt_template:
@@ -154,51 +384,152 @@ class LLM:
         print(history_text)
         print(prompt)
 
-        for i, llm_client in enumerate(self._clients):
-            try:
-                print(f"  Trying API #{i+1} ({llm_client.model})...")
+        # Failover in routing order; with hedging, a slow attempt also races the next provider
+        queue = self._route()
+        attempts: Dict["asyncio.Future[Optional[str]]", Tuple[int, LLMClient, bool, float]] = {}
+        loop = asyncio.get_running_loop()
+
+        def launch(hedge: bool) -> bool:
+            while queue:
+                i, llm_client = queue.pop(0)
+                if not llm_client.breaker.allow():
+                    metrics.inc("llm.breaker_skipped")
+                    print(f"  Skipping API #{i+1}: circuit open")
+                    continue
+                task = asyncio.ensure_future(self._try_insult(i, llm_client, prompt, image_url))
+                attempts[task] = (i, llm_client, hedge, loop.time())
+                return True
+            return False
 
-                if image_base64 and llm_client.supports_images:
-                    user_content = [
-                        {"type": "text", "text": prompt},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:{image_mime};base64,{image_base64}",
-                            },
-                        },
-                    ]
-                else:
-                    user_content = prompt
+        launch(hedge=False)
+        try:
+            while attempts:
+                delay = None
+                if self._hedging and queue and len(attempts) == 1:
+                    _, llm_client, _, started = next(iter(attempts.values()))
+                    delay = max(0.0, started + llm_client.hedge_threshold(self._hedge_delay) - loop.time())
+                done, _ = await asyncio.wait(attempts, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if launch(hedge=True):
+                        metrics.inc("llm.hedges")
+                        print(f"  Hedging: no answer after {delay:.1f}s, racing the next API")
+                    continue
+                for task in done:
+                    i, _, hedge, _ = attempts.pop(task)
+                    content = task.result()
+                    if content is not None:
+                        if hedge:
+                            metrics.inc("llm.hedge_wins")
+                            print(f"  Hedge API #{i+1} won")
+                        return content
+                if not attempts:
+                    launch(hedge=False)
+        finally:
+            for task in attempts:
+                task.cancel()
 
-                response = llm_client.client.chat.completions.create(
+        print("  ❌ All APIs failed")
+        return None
+
+    async def _try_insult(
+        self, i: int, llm_client: LLMClient, prompt: str, image_url: Optional[str]
+    ) -> Optional[str]:
+        """One provider attempt; None when it fails or its answer is blocked."""
+        started = time.monotonic()
+        try:
+            print(f"  Trying API #{i+1} ({llm_client.model})...")
+
+            if image_url and llm_client.supports_images:
+                user_content = [
+                    {"type": "text", "text": prompt},
+                    {
+                        "type": "image_url",
+                        "image_url": {"url": image_url},
+                    },
+                ]
+            else:
+                user_content = prompt
+
+            messages = [
+                {
+                    "role": "user",
+                    "content": user_content,
+                }
+            ]
+            if self._streaming:
+                content = await self._stream_insult(llm_client, messages)
+            else:
+                response = await llm_client.client.chat.completions.create(
                     model=llm_client.model,
-                    messages=[
-                        {
-                            "role": "user",
-                            "content": user_content,
-                        }
-                    ],
+                    messages=messages,
                 )
                 content = response.choices[0].message.content
 
-                if llm_client.is_blocked_response(content):
-                    print(f"  ⚠️  API #{i+1}: blocked: {content[:80]}...")
-                    continue
-                
-                print(f"  ✅ API #{i+1}: success")
-                return content
+            if llm_client.is_blocked_response(content):
+                print(f"  ⚠️  API #{i+1}: blocked: {(content or '')[:80]}...")
+                llm_client.breaker.record_failure()
+                llm_client.observe(False, time.monotonic() - started)
+                return None
+
+            print(f"  ✅ API #{i+1}: success")
+            llm_client.breaker.record_success()
+            llm_client.observe(True, time.monotonic() - started)
+            return content
+
+        except asyncio.CancelledError:
+            llm_client.breaker.record_cancelled()
+            llm_client.observe_cancelled(time.monotonic() - started)
+            raise
+        except Exception as exc:
+            print(f"  ❌ API #{i+1}: error - {exc}")
+            llm_client.breaker.record_failure()
+            llm_client.observe(False, time.monotonic() - started)
+            return None
 
-            except Exception as exc:
-                print(f"  ❌ API #{i+1}: error - {exc}")
-                continue
-        
-        print("  ❌ All APIs failed")
-        return None
+    async def _stream_insult(self, llm_client: LLMClient, messages: list) -> Optional[str]:
+        """Read a streamed completion until it ends, hits the reply limits or turns out blocked.
 
-    def describe_image(
-        self, image_base64: str, image_mime: str = "image/jpeg"
-    ) -> Optional[str]:
+        A blocked prefix is returned as is (the caller rejects it) so failover
+        starts before the refusal is complete; a content_filter finish gives None.
+        """
+        stream = await llm_client.client.chat.completions.create(
+            model=llm_client.model,
+            messages=messages,
+            stream=True,
+        )
+        parts: List[str] = []
+        async with stream:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                if choice.finish_reason == "content_filter":
+                    return None
+                if not choice.delta.content:
+                    continue
+                parts.append(choice.delta.content)
+                text = "".join(parts)
+                if _has_blocked_pattern(text):
+                    metrics.inc("llm.stream_blocked_early")
+                    return text
+                cutoff = _reply_cutoff(text, self._max_reply_sentences, self._max_reply_chars)
+                if cutoff is not None:
+                    # Leaving the block closes the connection, so generation stops too
+                    metrics.inc("llm.stream_cutoffs")
+                    return text[:cutoff].rstrip()
+        return "".join(parts)
+
+    def _route(self) -> List[Tuple[int, LLMClient]]:
+        """Providers by expected completion time; the configured order breaks ties."""
+        ranked = sorted(enumerate(self._clients), key=lambda item: (item[1].expected_time(), item[0]))
+        if len(ranked) > 1 and random.random() < self._exploration:
+            explored = ranked.pop(random.randrange(1, len(ranked)))
+            ranked.insert(0, explored)
+            metrics.inc("llm.explored")
+        return ranked
+
+    async def adescribe_image(self, image_url: str) -> Optional[str]:
+        """Describe an image given as a URL (usually a ``data:`` URL)."""
         # Use dedicated image client if configured, otherwise fall back to first supports_images client
         clients_to_try: List[LLMClient] = []
         if self._image_client:
@@ -210,9 +541,12 @@ class LLM:
                     break
 
         for i, llm_client in enumerate(clients_to_try):
+            if not llm_client.breaker.allow():
+                metrics.inc("llm.breaker_skipped")
+                continue
             try:
                 print(f"  describe_image: trying {llm_client.model}...")
-                response = llm_client.client.chat.completions.create(
+                response = await llm_client.client.chat.completions.create(
                     model=llm_client.model,
                     messages=[
                         {
@@ -224,9 +558,7 @@ class LLM:
                                 },
                                 {
                                     "type": "image_url",
-                                    "image_url": {
-                                        "url": f"data:{image_mime};base64,{image_base64}",
-                                    },
+                                    "image_url": {"url": image_url},
                                 },
                             ],
                         }
@@ -236,9 +568,15 @@ class LLM:
                 if content:
                     desc = content.strip().rstrip(".")
                     print(f"  describe_image: ✅ {desc}")
+                    llm_client.breaker.record_success()
                     return desc
+                llm_client.breaker.record_failure()
+            except asyncio.CancelledError:
+                llm_client.breaker.record_cancelled()
+                raise
             except Exception as exc:
                 print(f"  describe_image: ❌ {llm_client.model} error - {exc}")
+                llm_client.breaker.record_failure()
                 continue
         return None
 
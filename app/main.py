@@ -1,13 +1,20 @@
 import logging
 import os
 
+from typing import Callable, Tuple
+from urllib.parse import urlparse
+
 from telebot import TeleBot
+from telebot.types import Update
 
 from app.admin import AdminService
-from app.bot import register_handlers
-from app.config import load_settings
+from app.bot import ALLOWED_UPDATES, register_handlers
+from app.config import Settings, load_settings
 from app.db import Database
+from app.dispatch import KeyedDispatcher
 from app.llm import LLM
+from app.sharding import ShardSupervisor, poll_updates
+from app.webhook import WebhookServer, feed_bot
 
 logger = logging.getLogger(__name__)
 
@@ -16,22 +23,108 @@ def main():
     db_dir = os.path.dirname(settings.database_path)
     if db_dir:
         os.makedirs(db_dir, exist_ok=True)
-    bot = TeleBot(settings.token)
-    db = Database.init(settings.database_path)
+    if settings.shards > 1:
+        _run_supervisor(settings)
+        return
+
+    # Handlers run on the per-chat dispatcher; polling only has to enqueue in order
+    bot = TeleBot(settings.token, threaded=False)
+    db, llm, admin_service = _build_services(settings)
+
+    try:
+        _register(bot, db, llm, admin_service, settings)
+        if settings.webhook_url:
+            _run_webhook(bot, feed_bot(bot), settings)
+        else:
+            bot.remove_webhook()
+            bot.infinity_polling(
+                timeout=60,
+                long_polling_timeout=60,
+                allowed_updates=ALLOWED_UPDATES,
+            )
+    finally:
+        db.close()
+
+
+def _build_services(settings: Settings) -> Tuple[Database, LLM, AdminService]:
+    db = Database.init(settings.database_path, read_pool_size=settings.database_read_pool_size)
     llm = LLM(
         llm_configs=settings.llm_configs,
         image_config=settings.llm_image_config,
         tokens_username=settings.llm_tokens_username,
         tokens_password=settings.llm_tokens_password,
+        max_concurrency=settings.llm_max_concurrency,
+        max_pending=settings.llm_max_pending,
+        breaker_failures=settings.llm_breaker_failures,
+        breaker_cooldown=settings.llm_breaker_cooldown,
+        hedging=settings.llm_hedging,
+        hedge_delay=settings.llm_hedge_delay,
+        exploration=settings.llm_exploration,
+        streaming=settings.llm_streaming,
+        max_reply_sentences=settings.llm_max_reply_sentences,
+        max_reply_chars=settings.llm_max_reply_chars,
+    )
+    return db, llm, AdminService(db)
+
+
+def _register(bot: TeleBot, db: Database, llm: LLM, admin_service: AdminService, settings: Settings) -> None:
+    register_handlers(
+        bot, db, llm, admin_service,
+        llm_timeout=settings.llm_reply_timeout,
+        dispatcher=KeyedDispatcher(settings.handler_workers),
+        describe_images=settings.describe_images,
     )
-    admin_service = AdminService(db)
 
+
+def _run_supervisor(settings: Settings) -> None:
+    """Router process of the sharded mode: owns intake, workers own the chats."""
+    supervisor = ShardSupervisor(settings.shards, _run_shard, settings)
+    supervisor.start()
+    try:
+        if settings.webhook_url:
+            _run_webhook(TeleBot(settings.token, threaded=False), supervisor.route_payload, settings)
+        else:
+            TeleBot(settings.token, threaded=False).remove_webhook()
+            poll_updates(settings.token, supervisor.route, ALLOWED_UPDATES)
+    finally:
+        supervisor.stop()
+
+
+def _run_shard(settings: Settings, shard_index: int, updates) -> None:
+    """Worker process of the sharded mode; handles the updates routed to it."""
+    print(f"Shard {shard_index} ready")
+    bot = TeleBot(settings.token, threaded=False)
+    db, llm, admin_service = _build_services(settings)
     try:
-        register_handlers(bot, db, llm, admin_service)
-        bot.infinity_polling(timeout=60, long_polling_timeout=60)
+        _register(bot, db, llm, admin_service, settings)
+        while True:
+            update = updates.get()
+            if update is None:
+                break
+            bot.process_new_updates([Update.de_json(update)])
+    except KeyboardInterrupt:
+        pass
     finally:
         db.close()
 
 
+def _run_webhook(bot: TeleBot, consumer: Callable[[str], None], settings: Settings) -> None:
+    server = WebhookServer(
+        consumer,
+        settings.webhook_listen,
+        settings.webhook_port,
+        path=urlparse(settings.webhook_url).path or "/",
+        secret_token=settings.webhook_secret,
+        queue_size=settings.webhook_queue_size,
+    )
+    bot.set_webhook(
+        url=settings.webhook_url,
+        secret_token=settings.webhook_secret or None,
+        allowed_updates=ALLOWED_UPDATES,
+    )
+    print(f"Webhook server listening on {settings.webhook_listen}:{settings.webhook_port}")
+    server.serve_forever()
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,111 @@
+from collections import deque
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+
+if TYPE_CHECKING:
+    from app.db import QuestionTemplate
+
+QUESTION_PREFIX = "быдлик "
+
+
+class PatternMatcher:
+    """Aho-Corasick automaton over an ordered list of patterns.
+
+    ``search`` scans the text once and reports the pattern with the lowest
+    index among all patterns that occur in it, at its first occurrence. That
+    is the same answer as trying ``text.find`` for each pattern in order and
+    stopping at the first hit.
+    """
+
+    def __init__(self, patterns: Sequence[str]) -> None:
+        self.patterns: List[str] = list(patterns)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # Lowest pattern index ending at each node, following failure links; -1 for none
+        self._best: List[int] = [-1]
+        # Every pattern index ending at each node, following failure links
+        self._outputs: List[List[int]] = [[]]
+
+        for index, pattern in enumerate(self.patterns):
+            if not pattern:
+                continue
+            node = 0
+            for char in pattern:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][char] = next_node
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._best.append(-1)
+                    self._outputs.append([])
+                node = next_node
+            if self._best[node] == -1:
+                self._best[node] = index
+            self._outputs[node].append(index)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                self._outputs[child] = self._outputs[child] + self._outputs[self._fail[child]]
+                inherited = self._best[self._fail[child]]
+                if inherited != -1 and (self._best[child] == -1 or inherited < self._best[child]):
+                    self._best[child] = inherited
+
+    def search(self, text: str) -> Optional[Tuple[int, int]]:
+        """Return (pattern index, end offset) of the winning match, or None."""
+        goto = self._goto
+        fail = self._fail
+        best_nodes = self._best
+        best: Optional[Tuple[int, int]] = None
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            found = best_nodes[node]
+            if found != -1 and (best is None or found < best[0]):
+                best = (found, position + 1)
+                if found == 0:
+                    break
+        return best
+
+    def find_all(self, text: str) -> Dict[int, int]:
+        """Return {pattern index: end offset of its first occurrence} for every pattern in the text."""
+        goto = self._goto
+        fail = self._fail
+        outputs = self._outputs
+        found: Dict[int, int] = {}
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for index in outputs[node]:
+                if index not in found:
+                    found[index] = position + 1
+        return found
+
+
+class QuestionMatcher:
+    """Compiled "быдлик <trigger>" lookup over a list of question templates."""
+
+    def __init__(self, templates: Sequence["QuestionTemplate"]) -> None:
+        self.templates: List["QuestionTemplate"] = list(templates)
+        self._matcher = PatternMatcher(
+            [f"{QUESTION_PREFIX}{template.trigger_text}" for template in self.templates]
+        )
+
+    def match(self, text: str) -> Optional[Tuple["QuestionTemplate", str]]:
+        """Return the matching template and the question text after the trigger."""
+        found = self._matcher.search(text)
+        if found is None:
+            return None
+        index, end = found
+        return self.templates[index], text[end:]
@@ -0,0 +1,156 @@
+import base64
+import hashlib
+import threading
+import time
+
+from dataclasses import dataclass
+from typing import Optional, Sequence, Tuple
+
+import requests
+
+from telebot import apihelper
+
+from app.metrics import metrics
+
+# Photos above this size are never fetched (Telegram's own photo sizes stay far below it)
+MEDIA_MAX_BYTES = 5 * 1024 * 1024
+# Total time allowed for resolving and downloading one file
+MEDIA_DOWNLOAD_TIMEOUT = 15.0
+MEDIA_MAX_CONCURRENT_DOWNLOADS = 4
+_CHUNK_SIZE = 64 * 1024
+
+DEFAULT_MIME = "image/jpeg"
+_MIME_BY_EXTENSION = {".png": "image/png", ".webp": "image/webp"}
+
+
+class MediaFetcher:
+    """Downloads Telegram files with a size cap, a deadline and a concurrency limit."""
+
+    def __init__(
+        self,
+        bot,
+        max_bytes: int = MEDIA_MAX_BYTES,
+        timeout: float = MEDIA_DOWNLOAD_TIMEOUT,
+        max_concurrent: int = MEDIA_MAX_CONCURRENT_DOWNLOADS,
+    ) -> None:
+        self._bot = bot
+        self.max_bytes = max_bytes
+        self._timeout = timeout
+        self._slots = threading.BoundedSemaphore(max(1, max_concurrent))
+
+    def fetch(self, file_id: str) -> Optional[Tuple[bytes, str]]:
+        """Return (bytes, mime type), or None if the file is too big, slow or unavailable."""
+        deadline = time.monotonic() + self._timeout
+        if not self._slots.acquire(timeout=self._timeout):
+            metrics.inc("media.busy")
+            return None
+        try:
+            file_info = self._bot.get_file(file_id)
+            if file_info.file_size and file_info.file_size > self.max_bytes:
+                metrics.inc("media.too_large")
+                return None
+            data = self._download(file_info.file_path, deadline)
+        except Exception as exc:
+            metrics.inc("media.failed")
+            print(f"Failed to download photo: {exc}")
+            return None
+        finally:
+            self._slots.release()
+        if data is None:
+            return None
+        metrics.inc("media.downloaded")
+        metrics.inc("media.downloaded_bytes", len(data))
+        return data, _guess_mime(file_info.file_path)
+
+    def _download(self, file_path: str, deadline: float) -> Optional[bytes]:
+        url_template = apihelper.FILE_URL or "https://api.telegram.org/file/bot{0}/{1}"
+        url = url_template.format(self._bot.token, file_path)
+        timeout = max(0.1, deadline - time.monotonic())
+        chunks = []
+        received = 0
+        with requests.get(url, stream=True, timeout=timeout, proxies=apihelper.proxy) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(_CHUNK_SIZE):
+                received += len(chunk)
+                if received > self.max_bytes:
+                    metrics.inc("media.too_large")
+                    return None
+                if time.monotonic() > deadline:
+                    metrics.inc("media.timeouts")
+                    return None
+                chunks.append(chunk)
+        return b"".join(chunks)
+
+
+def _guess_mime(file_path: Optional[str]) -> str:
+    lowered = (file_path or "").lower()
+    for extension, mime in _MIME_BY_EXTENSION.items():
+        if lowered.endswith(extension):
+            return mime
+    return DEFAULT_MIME
+
+
+@dataclass(frozen=True)
+class ImageBudget:
+    """How much image a vision call can use; 0 means no limit.
+
+    ``max_side`` is the long side in pixels the provider actually looks at
+    (bigger images are downscaled by it anyway); ``max_bytes`` caps the file.
+    """
+
+    max_side: int = 0
+    max_bytes: int = 0
+
+
+def select_photo_size(photo_sizes: Sequence, budget: ImageBudget, max_bytes: int = 0):
+    """Pick the smallest PhotoSize that meets ``budget.max_side`` within the byte caps.
+
+    Without a pixel budget the largest size that fits is taken. If no size
+    fits the byte caps, the smallest one is returned (the fetcher rejects it
+    if it really is too big).
+    """
+    caps = [cap for cap in (budget.max_bytes, max_bytes) if cap]
+    byte_cap = min(caps) if caps else 0
+    # Telegram lists sizes from smallest to largest
+    fitting = [
+        size for size in photo_sizes if not byte_cap or not size.file_size or size.file_size <= byte_cap
+    ]
+    if not fitting:
+        return photo_sizes[0]
+    if budget.max_side:
+        for size in fitting:
+            if max(size.width, size.height) >= budget.max_side:
+                return size
+    return fitting[-1]
+
+
+class MediaHandle:
+    """A message photo that is only downloaded when something first asks for it.
+
+    Holds the file ids of the PhotoSize chosen for ``budget``. The first
+    download is encoded once into a data URL that every vision call reuses;
+    the raw bytes are not kept. A failed download is remembered too.
+    """
+
+    def __init__(self, fetcher: MediaFetcher, photo_sizes: Sequence, budget: ImageBudget = ImageBudget()) -> None:
+        photo = select_photo_size(photo_sizes, budget, fetcher.max_bytes)
+        self.file_id: str = photo.file_id
+        self.file_unique_id: str = photo.file_unique_id
+        # SHA-256 of the downloaded bytes, set by the first successful download
+        self.content_hash: Optional[str] = None
+        self._fetcher = fetcher
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._data_url: Optional[str] = None
+
+    def data_url(self) -> Optional[str]:
+        """Return the photo as a ``data:`` URL, or None when the download failed."""
+        with self._lock:
+            if not self._loaded:
+                fetched = self._fetcher.fetch(self.file_id)
+                if fetched is not None:
+                    data, mime = fetched
+                    self.content_hash = hashlib.sha256(data).hexdigest()
+                    self._data_url = f"data:{mime};base64,{base64.b64encode(data).decode('ascii')}"
+                self._loaded = True
+            return self._data_url
@@ -0,0 +1,44 @@
+import time
+
+from typing import Optional, Tuple
+
+from app.cache import LRUCache
+
+# How long a looked-up chat member status is trusted
+MEMBER_STATUS_TTL = 6 * 3600.0
+# Failed lookups are remembered for less time so a transient API error heals
+MEMBER_STATUS_ERROR_TTL = 600.0
+MEMBER_STATUS_CACHE_SIZE = 100_000
+
+
+class MemberStatusCache:
+    """Telegram member status per (chat_id, user_id) with expiry.
+
+    A cached ``None`` status means the lookup failed (negative entry); callers
+    should not retry until it expires.
+    """
+
+    def __init__(
+        self,
+        ttl: float = MEMBER_STATUS_TTL,
+        error_ttl: float = MEMBER_STATUS_ERROR_TTL,
+        maxsize: int = MEMBER_STATUS_CACHE_SIZE,
+    ) -> None:
+        self._ttl = ttl
+        self._error_ttl = error_ttl
+        self._entries: LRUCache[Tuple[int, int], Tuple[Optional[str], float]] = LRUCache(maxsize)
+
+    def lookup(self, chat_id: int, user_id: int) -> Tuple[bool, Optional[str]]:
+        """Return (hit, status); ``hit`` is False when the entry is missing or expired."""
+        entry = self._entries.get((chat_id, user_id))
+        if entry is None:
+            return False, None
+        status, expires_at = entry
+        if expires_at <= time.monotonic():
+            self._entries.pop((chat_id, user_id))
+            return False, None
+        return True, status
+
+    def store(self, chat_id: int, user_id: int, status: Optional[str]) -> None:
+        ttl = self._ttl if status is not None else self._error_ttl
+        self._entries.put((chat_id, user_id), (status, time.monotonic() + ttl))
@@ -0,0 +1,40 @@
+import threading
+
+from typing import Dict
+
+
+class Metrics:
+    """Process-wide named counters and gauges.
+
+    Values are plain floats keyed by dotted names (``db.read_wait_seconds``);
+    ``inc`` accumulates counters and ``set`` overwrites gauges.
+    """
+
+    def __init__(self) -> None:
+        self._values: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1.0) -> None:
+        with self._lock:
+            self._values[name] = self._values.get(name, 0.0) + value
+
+    def set(self, name: str, value: float) -> None:
+        with self._lock:
+            self._values[name] = value
+
+    def get(self, name: str, default: float = 0.0) -> float:
+        with self._lock:
+            return self._values.get(name, default)
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._values)
+
+
+metrics = Metrics()
+
+
+def format_metrics(values: Dict[str, float]) -> str:
+    if not values:
+        return "Метрик пока нет"
+    return "\n".join(f"{name}: {value:g}" for name, value in sorted(values.items()))
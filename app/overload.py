@@ -0,0 +1,95 @@
+import threading
+import time
+
+from typing import Sequence
+
+from app.metrics import metrics
+
+TIER_NORMAL = 0
+TIER_NO_IMAGE_DESCRIPTION = 1
+TIER_FALLBACK_INSULTS = 2
+TIER_NO_RANDOM_INSULTS = 3
+TIER_COMMANDS_ONLY = 4
+TIER_NAMES = {
+    TIER_NORMAL: "normal",
+    TIER_NO_IMAGE_DESCRIPTION: "no image descriptions",
+    TIER_FALLBACK_INSULTS: "fallback insults",
+    TIER_NO_RANDOM_INSULTS: "no random insults",
+    TIER_COMMANDS_ONLY: "commands only",
+}
+
+# Queued updates at which tiers 1..4 start
+DEPTH_THRESHOLDS = (20, 50, 100, 200)
+# Smoothed message age in seconds (Telegram date -> handler start) at which tiers 1..4 start
+LAG_THRESHOLDS = (3.0, 10.0, 30.0, 60.0)
+LAG_SMOOTHING = 0.2
+# The tier steps down by one per this many seconds once the load allows it
+RECOVERY_SECONDS = 10.0
+
+
+def _tier_for(value: float, thresholds: Sequence[float]) -> int:
+    tier = TIER_NORMAL
+    for index, threshold in enumerate(thresholds):
+        if value >= threshold:
+            tier = index + 1
+    return tier
+
+
+class OverloadController:
+    """Chooses a degradation tier from intake backlog and handler lag.
+
+    The tier rises as soon as either signal crosses a threshold and falls
+    one step per ``RECOVERY_SECONDS`` afterwards, so it does not flap while a
+    backlog drains. Changes are logged and exported as ``overload.tier``.
+    """
+
+    def __init__(
+        self,
+        depth_thresholds: Sequence[int] = DEPTH_THRESHOLDS,
+        lag_thresholds: Sequence[float] = LAG_THRESHOLDS,
+        recovery_seconds: float = RECOVERY_SECONDS,
+    ) -> None:
+        self._depth_thresholds = depth_thresholds
+        self._lag_thresholds = lag_thresholds
+        self._recovery_seconds = recovery_seconds
+        self._depth = 0
+        self._lag = 0.0
+        self._tier = TIER_NORMAL
+        self._changed_at = time.monotonic()
+        self._lock = threading.Lock()
+        metrics.set("overload.tier", self._tier)
+
+    @property
+    def tier(self) -> int:
+        return self._tier
+
+    def observe_depth(self, depth: int) -> None:
+        with self._lock:
+            self._depth = depth
+            self._update()
+
+    def observe_lag(self, seconds: float) -> None:
+        with self._lock:
+            self._lag += LAG_SMOOTHING * (max(0.0, seconds) - self._lag)
+            self._update()
+
+    def _update(self) -> None:
+        target = max(
+            _tier_for(self._depth, self._depth_thresholds),
+            _tier_for(self._lag, self._lag_thresholds),
+        )
+        now = time.monotonic()
+        if target > self._tier:
+            tier = target
+        else:
+            steps = int((now - self._changed_at) // self._recovery_seconds)
+            tier = max(target, self._tier - steps)
+        if tier == self._tier:
+            return
+        print(
+            f"Overload tier {self._tier} -> {tier} ({TIER_NAMES[tier]}): "
+            f"queue {self._depth}, lag {self._lag:.1f}s"
+        )
+        self._tier = tier
+        self._changed_at = now
+        metrics.set("overload.tier", tier)
@@ -0,0 +1,51 @@
+import random
+
+from typing import Generic, List, Sequence, TypeVar
+
+T = TypeVar("T")
+
+
+class AliasSampler(Generic[T]):
+    """Weighted random choice in O(1) per pick (Vose's alias method).
+
+    Building the tables is O(n); items with a non-positive weight are never
+    picked.
+    """
+
+    def __init__(self, items: Sequence[T], weights: Sequence[float]) -> None:
+        pairs = [(item, float(weight)) for item, weight in zip(items, weights) if weight > 0]
+        if not pairs:
+            raise ValueError("AliasSampler needs at least one item with a positive weight")
+
+        self._items: List[T] = [item for item, _ in pairs]
+        count = len(pairs)
+        total = sum(weight for _, weight in pairs)
+        scaled = [weight * count / total for _, weight in pairs]
+        self._probability = [0.0] * count
+        self._alias = [0] * count
+
+        small = [index for index, value in enumerate(scaled) if value < 1.0]
+        large = [index for index, value in enumerate(scaled) if value >= 1.0]
+        while small and large:
+            less = small.pop()
+            more = large.pop()
+            self._probability[less] = scaled[less]
+            self._alias[less] = more
+            scaled[more] = scaled[more] + scaled[less] - 1.0
+            if scaled[more] < 1.0:
+                small.append(more)
+            else:
+                large.append(more)
+        # Whatever is left is 1.0 up to rounding error
+        for index in large + small:
+            self._probability[index] = 1.0
+
+    def sample(self, rng: random.Random | None = None) -> T:
+        rng = rng or random
+        column = rng.randrange(len(self._items))
+        if rng.random() < self._probability[column]:
+            return self._items[column]
+        return self._items[self._alias[column]]
+
+    def __len__(self) -> int:
+        return len(self._items)
@@ -0,0 +1,75 @@
+import heapq
+import itertools
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Tuple
+
+# Callbacks may do blocking Telegram calls; they run here so timers stay on time
+SCHEDULER_WORKERS = 4
+
+
+class ScheduledCall:
+    """Handle returned by ``DelayedScheduler.call_later``."""
+
+    __slots__ = ("func", "args", "cancelled")
+
+    def __init__(self, func: Callable[..., Any], args: Tuple[Any, ...]) -> None:
+        self.func = func
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+
+class DelayedScheduler:
+    """Runs callbacks after a delay without holding a thread per wait.
+
+    Due times live in a min-heap watched by one timer thread; due callbacks are
+    handed to a small worker pool. Both threads start on first use.
+    """
+
+    def __init__(self, workers: int = SCHEDULER_WORKERS, name: str = "scheduler") -> None:
+        self._workers = workers
+        self._name = name
+        self._heap: List[Tuple[float, int, ScheduledCall]] = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self._executor: ThreadPoolExecutor | None = None
+
+    def call_later(self, delay: float, func: Callable[..., Any], *args: Any) -> ScheduledCall:
+        call = ScheduledCall(func, args)
+        with self._condition:
+            self._ensure_started()
+            heapq.heappush(self._heap, (time.monotonic() + max(0.0, delay), next(self._counter), call))
+            self._condition.notify()
+        return call
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix=self._name)
+        self._thread = threading.Thread(target=self._run, name=f"{self._name}-timer", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._condition.wait(timeout)
+                _, _, call = heapq.heappop(self._heap)
+            if not call.cancelled:
+                self._executor.submit(self._invoke, call)
+
+    @staticmethod
+    def _invoke(call: ScheduledCall) -> None:
+        if call.cancelled:
+            return
+        try:
+            call.func(*call.args)
+        except Exception as exc:
+            print(f"Scheduled call {getattr(call.func, '__name__', call.func)} failed: {exc}")
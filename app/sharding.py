@@ -0,0 +1,155 @@
+import bisect
+import hashlib
+import json
+import multiprocessing
+import threading
+import time
+
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from telebot import apihelper
+
+from app.metrics import metrics
+
+# Updates waiting for one shard; when full, intake blocks until the shard catches up
+SHARD_QUEUE_SIZE = 1000
+# Virtual points per shard on the hash ring; more points even out the load
+HASH_REPLICAS = 64
+SHARD_CHECK_INTERVAL = 5.0
+POLL_RETRY_DELAY = 3.0
+# Update fields whose object carries the chat the update belongs to
+_CHAT_FIELDS = (
+    "message",
+    "edited_message",
+    "channel_post",
+    "edited_channel_post",
+    "chat_member",
+    "my_chat_member",
+    "chat_join_request",
+)
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class ConsistentHashRing:
+    """Maps keys to nodes so that adding a node moves only ~1/N of the keys."""
+
+    def __init__(self, nodes: Iterable[int], replicas: int = HASH_REPLICAS) -> None:
+        points: List[Tuple[int, int]] = sorted(
+            (_hash(f"{node}:{replica}"), node) for node in nodes for replica in range(replicas)
+        )
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node_for(self, key: Any) -> int:
+        index = bisect.bisect(self._hashes, _hash(str(key))) % len(self._hashes)
+        return self._nodes[index]
+
+
+def update_chat_id(update: Dict[str, Any]) -> Optional[int]:
+    """Chat id of a raw update dict, or None for updates without a chat."""
+    for field in _CHAT_FIELDS:
+        chat = (update.get(field) or {}).get("chat")
+        if chat:
+            return chat.get("id")
+    message = (update.get("callback_query") or {}).get("message") or {}
+    chat = message.get("chat")
+    return chat.get("id") if chat else None
+
+
+class ShardSupervisor:
+    """Runs worker processes and routes raw updates to them by chat id.
+
+    Each worker gets a bounded queue and handles every update of the chats
+    hashed to it, so in-memory per-chat state stays in one process. Workers
+    are spawned fresh (no forked threads) and restarted if they die.
+    ``target(*args, shard_index, queue)`` is the worker entry point; it reads
+    update dicts from the queue until it receives None.
+    """
+
+    def __init__(
+        self,
+        shards: int,
+        target: Callable[..., None],
+        *args: Any,
+        queue_size: int = SHARD_QUEUE_SIZE,
+    ) -> None:
+        self._context = multiprocessing.get_context("spawn")
+        self._target = target
+        self._args = args
+        self._queues = [self._context.Queue(maxsize=queue_size) for _ in range(shards)]
+        self._processes: List[Optional[multiprocessing.Process]] = [None] * shards
+        self._ring = ConsistentHashRing(range(shards))
+        self._stopping = threading.Event()
+        self._watcher = threading.Thread(target=self._watch, name="shard-watcher", daemon=True)
+
+    def start(self) -> None:
+        for index in range(len(self._processes)):
+            self._spawn(index)
+        self._watcher.start()
+
+    def route(self, update: Dict[str, Any]) -> None:
+        key = update_chat_id(update)
+        if key is None:
+            key = update.get("update_id", 0)
+        shard = self._ring.node_for(key)
+        self._queues[shard].put(update)
+        metrics.inc("shard.routed")
+
+    def route_payload(self, payload: str) -> None:
+        """Route a raw JSON update body (webhook intake)."""
+        self.route(json.loads(payload))
+
+    def stop(self, timeout: float = 30.0) -> None:
+        self._stopping.set()
+        for queue in self._queues:
+            queue.put(None)
+        for process in self._processes:
+            if process is not None:
+                process.join(timeout)
+
+    def _spawn(self, index: int) -> None:
+        process = self._context.Process(
+            target=self._target,
+            args=(*self._args, index, self._queues[index]),
+            name=f"shard-{index}",
+        )
+        process.start()
+        self._processes[index] = process
+        print(f"Shard {index} started (pid {process.pid})")
+
+    def _watch(self) -> None:
+        while not self._stopping.wait(SHARD_CHECK_INTERVAL):
+            for index, process in enumerate(self._processes):
+                if process is not None and not process.is_alive() and not self._stopping.is_set():
+                    print(f"Shard {index} exited with code {process.exitcode}, restarting")
+                    metrics.inc("shard.restarts")
+                    self._spawn(index)
+
+
+def poll_updates(
+    token: str,
+    consumer: Callable[[Dict[str, Any]], None],
+    allowed_updates: List[str],
+    timeout: int = 60,
+) -> None:
+    """Long-poll getUpdates forever, passing each raw update dict to ``consumer``."""
+    offset = None
+    while True:
+        try:
+            updates = apihelper.get_updates(
+                token,
+                offset=offset,
+                timeout=timeout,
+                allowed_updates=allowed_updates,
+                long_polling_timeout=timeout,
+            )
+        except Exception as exc:
+            print(f"getUpdates failed: {exc}")
+            time.sleep(POLL_RETRY_DELAY)
+            continue
+        for update in updates:
+            offset = update["update_id"] + 1
+            consumer(update)
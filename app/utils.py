@@ -3,8 +3,10 @@ import re
 import threading
 import time
 
+from collections import deque
+from concurrent.futures import Future
 from datetime import date
-from typing import Dict, Union
+from typing import Callable, Deque, Dict, Optional, Set, Union
 
 # Unicode confusable characters → Cyrillic equivalents
 # Users on non-Cyrillic keyboards may type visually identical Latin characters
@@ -14,15 +16,94 @@ _CONFUSABLE_MAP: Dict[str, str] = {
 }
 
 from telebot import TeleBot
-from telebot.apihelper import ApiTelegramException
 
-from app.db import Database, QuestionTemplate, UserRecord
+from app.db import BOT_SELECTION, Database, QuestionTemplate, UserRecord
+from app.scheduler import DelayedScheduler
 from app.texts import QUANTITY_RESPONSES
 
 # Minimum interval (seconds) between send_chat_action calls per chat
 _CHAT_ACTION_THROTTLE_SECONDS = 5
 # Per-chat timestamp of last successful send_chat_action
 _last_chat_action: dict[int, float] = {}
+# Owns deferred replies and typing refreshes so handlers never sleep
+_reply_scheduler = DelayedScheduler(name="reply")
+
+
+class _ReplySlot:
+    __slots__ = ("chat_id", "due", "send", "sent")
+
+    def __init__(self, chat_id: int) -> None:
+        self.chat_id = chat_id
+        self.due = 0.0
+        self.send: Optional[Callable[[], Optional[Future]]] = None
+        self.sent = False
+
+
+class ReplyChain:
+    """Deferred replies of each chat, sent one at a time in the order they were decided.
+
+    A slot is reserved when the handler decides to reply and filled once the
+    text and its due time are known (an LLM answer may come much later). A
+    reply goes out no earlier than its due time and only after every earlier
+    reply of the same chat, so random delays cannot reorder them.
+    """
+
+    def __init__(self, scheduler: DelayedScheduler) -> None:
+        self._scheduler = scheduler
+        self._chats: Dict[int, Deque[_ReplySlot]] = {}
+        # Chats whose head reply is waiting for its timer or being sent
+        self._busy: Set[int] = set()
+        self._lock = threading.Lock()
+
+    def reserve(self, chat_id: int) -> _ReplySlot:
+        slot = _ReplySlot(chat_id)
+        with self._lock:
+            self._chats.setdefault(chat_id, deque()).append(slot)
+        return slot
+
+    def fill(self, slot: _ReplySlot, due: float, send: Callable[[], Optional[Future]]) -> None:
+        with self._lock:
+            slot.due = due
+            slot.send = send
+        self._pump(slot.chat_id)
+
+    def _pump(self, chat_id: int) -> None:
+        with self._lock:
+            if chat_id in self._busy:
+                return
+            slots = self._chats.get(chat_id)
+            if not slots:
+                self._chats.pop(chat_id, None)
+                return
+            head = slots[0]
+            if head.send is None:
+                return
+            self._busy.add(chat_id)
+        self._scheduler.call_later(head.due - time.monotonic(), self._send, head)
+
+    def _send(self, slot: _ReplySlot) -> None:
+        try:
+            pending = slot.send()
+        except Exception as exc:
+            print(f"Deferred reply failed: {exc}")
+            pending = None
+        if isinstance(pending, Future):
+            # Sent on the asyncio runtime's loop; the next reply waits for it there
+            pending.add_done_callback(lambda done: self._sent(slot, done))
+        else:
+            self._sent(slot, None)
+
+    def _sent(self, slot: _ReplySlot, done: Optional[Future]) -> None:
+        if done is not None and not done.cancelled() and done.exception() is not None:
+            print(f"Deferred reply failed: {done.exception()}")
+        with self._lock:
+            self._chats[slot.chat_id].popleft()
+            slot.sent = True
+            self._busy.discard(slot.chat_id)
+        self._pump(slot.chat_id)
+
+
+_replies = ReplyChain(_reply_scheduler)
 
 
 def when(date_choice, numbers):
@@ -47,12 +128,7 @@ def generate_seed(que, user_id):
 
 
 def select_user(db: Database, chat_id: int) -> Union[UserRecord, str]:
-    members = db.get_tagged_users(chat_id)
-    weighted_members: list[Union[UserRecord, str]] = []
-    for member in members:
-        weighted_members.extend([member, member])
-    weighted_members.append("bot")
-    return random.choice(weighted_members)
+    return db.get_chat_roster(chat_id).sample()
 
 
 def _send_chat_action_safe(bot: TeleBot, chat_id: int) -> None:
@@ -61,11 +137,17 @@ def _send_chat_action_safe(bot: TeleBot, chat_id: int) -> None:
     last = _last_chat_action.get(chat_id, 0)
     if now - last < _CHAT_ACTION_THROTTLE_SECONDS:
         return
+    submit = getattr(bot, "submit_chat_action", None)
+    if submit is not None:
+        # Asyncio runtime: fire and forget on the bot's loop
+        submit(chat_id, "typing")
+        _last_chat_action[chat_id] = now
+        return
     try:
         bot.send_chat_action(chat_id, "typing")
         _last_chat_action[chat_id] = now
-    except ApiTelegramException:
-        # 429 Too Many Requests or other API errors — silently ignore
+    except Exception:
+        # 429 Too Many Requests, other API or network errors — the typing status is cosmetic
         pass
 
 
@@ -76,10 +158,40 @@ def normalize_text(text: str) -> str:
     return text
 
 
-def reply_with_typing(bot: TeleBot, message, text: str) -> None:
-    _send_chat_action_safe(bot, message.chat.id)
-    time.sleep(random.randint(2, 7))
+def send_reply_to(bot: TeleBot, message, text: str) -> Optional[Future]:
+    """Reply now; the asyncio runtime's bridge returns a future instead of blocking."""
+    submit = getattr(bot, "submit_reply_to", None)
+    if submit is not None:
+        return submit(message, text)
     bot.reply_to(message, text)
+    return None
+
+
+def reply_with_typing(bot: TeleBot, message, text: str) -> None:
+    """Show typing, then reply after a humanlike delay; returns immediately.
+
+    The reply is sent after the chat's earlier deferred replies.
+    """
+    due = time.monotonic() + random.randint(2, 7)
+    slot = _replies.reserve(message.chat.id)
+    try:
+        _send_chat_action_safe(bot, message.chat.id)
+        _keep_typing(bot, message.chat.id, lambda: not slot.sent)
+    finally:
+        # An unfilled slot would hold back every later reply of the chat
+        _replies.fill(slot, due, lambda: send_reply_to(bot, message, text))
+
+
+def _keep_typing(bot: TeleBot, chat_id: int, is_pending: Callable[[], bool]) -> None:
+    # Telegram clears the typing status after ~5 seconds, so renew it while a reply is pending
+    _reply_scheduler.call_later(_CHAT_ACTION_THROTTLE_SECONDS, _refresh_typing, bot, chat_id, is_pending)
+
+
+def _refresh_typing(bot: TeleBot, chat_id: int, is_pending: Callable[[], bool]) -> None:
+    if not is_pending():
+        return
+    _send_chat_action_safe(bot, chat_id)
+    _keep_typing(bot, chat_id, is_pending)
 
 
 def handle_question_templates(
@@ -141,7 +253,7 @@ def format_question_response(
 ) -> str:
     mention = "Быдлик"
 
-    if selected != "bot":
+    if selected != BOT_SELECTION:
         mention = selected.username or ""
         if mention and selected.tag:
             mention = f"@{mention}"
@@ -173,20 +285,50 @@ def format_question_response(
     )
     return re.sub(r"[ ]{2,}", " ", response)
 
-def reply_with_min_delay(bot, message, llm_func, min_seconds=2):
+def reply_with_min_delay(
+    bot,
+    message,
+    future: "Future[Optional[str]]",
+    on_result: Callable[[Optional[str]], Optional[Future]],
+    min_seconds: int = 2,
+    timeout: float = 60.0,
+) -> None:
+    """Deliver an LLM result no sooner than a random minimum delay.
+
+    Typing is shown until the reply is sent. ``on_result`` receives the
+    future's result, or None if the call failed, was rejected or did not
+    finish within ``timeout`` (the future is then cancelled), sends the reply
+    and returns ``send_reply_to``'s result. The reply keeps
+    its place among the chat's deferred replies. Returns immediately;
+    everything else happens in callbacks.
+    """
     target_delay = random.randint(min_seconds, min_seconds + 5)
-    result = [None]
-
-    def _run():
-        result[0] = llm_func()
-
-    thread = threading.Thread(target=_run)
-    start = time.time()
-    thread.start()
+    started = time.monotonic()
+    slot = _replies.reserve(message.chat.id)
+    claimed = threading.Lock()
+
+    def finish(result: Optional[str]) -> None:
+        # Completion and timeout race; only the first one delivers
+        if not claimed.acquire(blocking=False):
+            return
+        _replies.fill(slot, started + target_delay, lambda: on_result(result))
+
+    def on_done(done: "Future[Optional[str]]") -> None:
+        if done.cancelled() or done.exception() is not None:
+            finish(None)
+        else:
+            finish(done.result())
+
+    def on_timeout() -> None:
+        if not future.done():
+            future.cancel()
+            print(f"  LLM call timed out after {timeout:.0f}s")
+            finish(None)
 
-    while thread.is_alive() or (time.time() - start) < target_delay:
+    try:
         _send_chat_action_safe(bot, message.chat.id)
-        time.sleep(1)
-
-    thread.join()
-    return result[0]
+        _keep_typing(bot, message.chat.id, lambda: not slot.sent)
+        _reply_scheduler.call_later(timeout, on_timeout)
+    finally:
+        # Whatever failed above, the slot still gets filled when the call ends
+        future.add_done_callback(on_done)
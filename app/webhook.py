@@ -0,0 +1,143 @@
+import hmac
+import queue
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Optional
+
+from telebot import TeleBot
+from telebot.types import Update
+
+from app.metrics import metrics
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+# Updates accepted but not yet handed to the bot; beyond this Telegram is told to retry
+WEBHOOK_QUEUE_SIZE = 1000
+# One worker hands updates to the bot in delivery order, which per-chat ordering relies on
+WEBHOOK_WORKERS = 1
+# Telegram never sends bigger update bodies; anything larger is not from it
+MAX_BODY_BYTES = 1 << 20
+
+
+def feed_bot(bot: TeleBot) -> Callable[[str], None]:
+    """Consumer that parses an update body and hands it to ``bot``."""
+
+    def consume(payload: str) -> None:
+        update = Update.de_json(payload)
+        if update is not None:
+            bot.process_new_updates([update])
+
+    return consume
+
+
+class WebhookServer:
+    """Minimal HTTP endpoint that feeds Telegram webhook updates to a consumer.
+
+    A POST is only checked (path, secret token, size) and parked in a bounded
+    queue, then answered right away; worker threads pass the raw body to
+    ``consumer`` (see ``feed_bot``). When the queue is full the request gets
+    503 so Telegram redelivers it later instead of the update being lost.
+    """
+
+    def __init__(
+        self,
+        consumer: Callable[[str], None],
+        host: str,
+        port: int,
+        path: str = "/",
+        secret_token: str = "",
+        queue_size: int = WEBHOOK_QUEUE_SIZE,
+        workers: int = WEBHOOK_WORKERS,
+    ) -> None:
+        self._consumer = consumer
+        self._path = path
+        self._secret_token = secret_token
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue(maxsize=max(1, queue_size))
+        self._workers: List[threading.Thread] = [
+            threading.Thread(target=self._work, name=f"webhook-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+
+    @property
+    def address(self):
+        return self._server.server_address
+
+    def serve_forever(self) -> None:
+        for worker in self._workers:
+            worker.start()
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            for _ in self._workers:
+                self._queue.put(None)
+
+    def shutdown(self) -> None:
+        self._server.shutdown()
+
+    def accept(self, payload: str) -> bool:
+        """Queue a raw update body; False when the intake queue is full."""
+        try:
+            self._queue.put_nowait(payload)
+        except queue.Full:
+            metrics.inc("webhook.rejected")
+            return False
+        metrics.inc("webhook.accepted")
+        metrics.set("webhook.queue_depth", self._queue.qsize())
+        return True
+
+    def is_authorized(self, token: Optional[str]) -> bool:
+        if not self._secret_token:
+            return True
+        # Bytes, because compare_digest rejects non-ASCII str (headers arrive as latin-1)
+        return token is not None and hmac.compare_digest(token.encode(), self._secret_token.encode())
+
+    def _work(self) -> None:
+        while True:
+            payload = self._queue.get()
+            if payload is None:
+                return
+            metrics.set("webhook.queue_depth", self._queue.qsize())
+            try:
+                self._consumer(payload)
+            except Exception as exc:
+                print(f"Webhook update failed: {exc}")
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self) -> None:
+                if self.path != server._path:
+                    self._respond(404)
+                    return
+                if not server.is_authorized(self.headers.get(SECRET_HEADER)):
+                    metrics.inc("webhook.unauthorized")
+                    self._respond(403)
+                    return
+                try:
+                    length = int(self.headers.get("Content-Length") or 0)
+                except ValueError:
+                    length = 0
+                if length <= 0 or length > MAX_BODY_BYTES:
+                    self._respond(400)
+                    return
+                try:
+                    payload = self.rfile.read(length).decode("utf-8")
+                except UnicodeDecodeError:
+                    self._respond(400)
+                    return
+                self._respond(200 if server.accept(payload) else 503)
+
+            def _respond(self, status: int) -> None:
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args) -> None:
+                # Per-request access logs would drown the bot output
+                pass
+
+        return Handler